@@ -46,6 +46,32 @@ import signal
 import subprocess
 import traceback
 import binascii
+import stat
+import struct
+import json
+import collections
+import socket
+import select
+import time
+import hashlib
+import random
+import fcntl
+import gzip
+import sqlite3
+import fnmatch
+import pipes
+import mmap
+import errno
+import zlib
+from xml.etree import ElementTree
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 TOOL_VERSION = "0.97"
 
@@ -69,11 +95,78 @@ TMP_DIR_INT = None
 
 ORIG_DIR = os.getcwd()
 
+PROBES = {}
+TASKS_N = 0
+RUNNING = {}
+QUEUED = {}
+JOURNAL = None
+DUMP_INDEX = {"roots":{}, "dumps":set(), "log":None}
+SHARED_DEVEL = {}
+EVENTS = None
+EVENT_TAGS = {}
+METRICS = {}
+METRICS_RUN = {}
+METRICS_START = time.time()
+
 CMD_NAME = os.path.basename(__file__)
+CMD_PATH = os.path.realpath(__file__)
+
+NOARCH = ["noarch", "all"]
+
+# files found in packages of each kind
+FILE_KIND = {"rel":"object", "debug":"debuginfo", "devel":"header"}
+
+ERROR_CODE = {"Ok":0, "Error":1, "Empty":10, "NoDebug":11, "NoABI":12, "Partial":13, "Break":14, "Cancelled":15}
+
+# abi-dumper memory estimate (KB) when there is no history:
+# MEM_BASE + MEM_PER_DWARF x size of DWARF sections
+MEM_BASE = 64*1024
+MEM_PER_DWARF = 12
+
+# task time estimates (seconds per byte of input) when there is no history
+DUMP_SEC_PER_BYTE = 1.0/(1024*1024)
+COMPARE_SEC_PER_BYTE = 0.2/(1024*1024)
 
-ERROR_CODE = {"Ok":0, "Error":1, "Empty":10, "NoDebug":11, "NoABI":12}
+# ABI dump size estimate (bytes per byte of installed debuginfo) when
+# there is no history
+DUMP_SIZE_PER_BYTE = 0.25
 
-def init_options():
+# compact ABI dumps: magic, offsets of the index table and metadata,
+# then zlib-compressed blocks of about COMPACT_BLOCK bytes of the text
+# dump, index items are section, block, position, size, number of names
+COMPACT_MAGIC = "PKGABID\x01"
+COMPACT_HEAD = ">8sQQ"
+COMPACT_ITEM = ">BQIIB"
+COMPACT_BLOCK = 64*1024
+
+# MinHash signatures of exported symbols, LSH bands of LSH_ROWS values
+MINHASH_N = 60
+MINHASH_PRIME = 4294967311
+MINHASH_PERMS = [(random.Random(i).randint(1, MINHASH_PRIME-1), random.Random(-i).randint(0, MINHASH_PRIME-1)) for i in range(1, MINHASH_N+1)]
+LSH_ROWS = 3
+
+# extraction cache entries used in the last SEC seconds are not evicted
+CACHE_GRACE = 3600
+
+# Prometheus metrics written by -metrics-file: type, help and how
+# values of several runs are merged
+METRIC_TYPES = {
+    "pkg_abidiff_runs_total":("counter", "Finished runs by exit status", "sum"),
+    "pkg_abidiff_run_seconds":("histogram", "Duration of runs by compared kinds (bin, src or both)", "sum"),
+    "pkg_abidiff_stage_seconds_total":("counter", "Time spent in stages", "sum"),
+    "pkg_abidiff_task_seconds":("histogram", "Duration of tasks", "sum"),
+    "pkg_abidiff_dump_seconds_per_dwarf_mb":("histogram", "Duration of ABI dumping per megabyte of DWARF", "sum"),
+    "pkg_abidiff_task_max_rss_bytes":("gauge", "Peak RSS of task processes", "max"),
+    "pkg_abidiff_extracted_bytes_total":("counter", "Size of extracted packages", "sum"),
+    "pkg_abidiff_cache_total":("counter", "Cache lookups and evictions", "sum"),
+    "pkg_abidiff_objects_total":("counter", "Objects by match result", "sum")
+}
+METRIC_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+
+# seconds without a heartbeat after which a claimed task is returned to the queue
+QUEUE_STALE = 60
+
+def init_options(argv=None):
     global TOOL_VERSION, CMD_NAME
     
     desc = "Check backward API/ABI compatibility of Linux packages (RPM or DEB)"
@@ -97,11 +190,182 @@ def init_options():
     parser.add_argument('-use-tu-dump', help='use g++ syntax tree instead of ctags to list symbols in headers', action='store_true')
     parser.add_argument('-include-preamble', help='specify preamble headers (separated by semicolon)', metavar='PATHS')
     parser.add_argument('-include-paths', help='specify include paths (separated by semicolon)', metavar='PATHS')
+    parser.add_argument('-serve', '--serve', help='run as a daemon accepting comparison jobs on a Unix socket', metavar='SOCKET')
+    parser.add_argument('-max-jobs', help='number of comparisons to run at a time in the daemon mode (default: 1) or the repository mode (default: twice the -j)', type=int, metavar='N')
+    parser.add_argument('-submit', help='submit the comparison to a daemon listening on a Unix socket', metavar='SOCKET')
+    parser.add_argument('-j', help='run N tasks (extraction, dumping, comparison) in parallel (default: 1)', type=int, default=1, metavar='N', dest='jobs')
+    parser.add_argument('-queue-dir', help='distribute tasks to workers through a work queue in a shared directory', metavar='DIR')
+    parser.add_argument('-worker', help='run as a worker executing tasks from the -queue-dir work queue', action='store_true')
+    parser.add_argument('-max-mem', help='do not run dumping tasks at a time if their estimated memory usage exceeds MB megabytes in total', type=int, metavar='MB')
+    parser.add_argument('-extract-timeout', help='kill package extraction after SEC seconds', type=int, metavar='SEC')
+    parser.add_argument('-dump-timeout', help='kill ABI dumping of an object after SEC seconds', type=int, metavar='SEC')
+    parser.add_argument('-compare-timeout', help='kill comparison of an object after SEC seconds', type=int, metavar='SEC')
+    parser.add_argument('-resume', help='continue an interrupted run from its journal', action='store_true')
+    parser.add_argument('-retries', help='retry failed or killed tasks N times (default: 0)', type=int, default=0, metavar='N')
+    parser.add_argument('-match-threshold', help='match removed and added objects if the similarity of their exported symbols is at least RATIO (default: 0.5)', type=float, default=0.5, metavar='RATIO')
+    parser.add_argument('-extract-cache', help='reuse extracted packages from a cache directory keyed by package checksums', metavar='DIR')
+    parser.add_argument('-extract-cache-size', help='evict least recently used packages from the extraction cache above MB megabytes (default: 20480)', type=int, default=20480, metavar='MB')
+    parser.add_argument('-old-repo', help='compare packages of a local repository directory (RPM or DEB files, repodata or Packages index) ...', metavar='DIR')
+    parser.add_argument('-new-repo', help='... with the changed packages of this repository', metavar='DIR')
+    parser.add_argument('-events', help='write progress events as JSON lines to a file or a file descriptor', metavar='FILE|FD')
+    parser.add_argument('-metrics-file', help='write Prometheus text format metrics at the end of the run, merged with the metrics of previous runs in the file', metavar='PATH')
+    parser.add_argument('-query-symbol', help='list ABI dumps in the -dumps-dir that export a symbol or define a type NAME (shell-style wildcards are allowed)', metavar='NAME')
+    parser.add_argument('-results-db', help='add results of comparisons to an SQLite database', metavar='PATH')
+    parser.add_argument('-query-results', help='list results of packages matching NAME (shell-style wildcards are allowed) from the -results-db database', metavar='NAME')
+    parser.add_argument('-bc-below', help='list only results with binary compatibility below PCT percent (with -query-results)', type=float, metavar='PCT')
+    parser.add_argument('-debug-store', help='look up debuginfo files of objects by build-id in a local store (a directory like /usr/lib/debug with .build-id/NN/ID.debug files) before extracting debuginfo packages, which are optional then', metavar='DIR')
+    parser.add_argument('-objects', help='check only objects with file names matching GLOBS (separated by semicolon), other files are not extracted', metavar='GLOBS')
+    parser.add_argument('-skip-objects', help='do not check objects with file names matching GLOBS (separated by semicolon)', metavar='GLOBS')
+    parser.add_argument('-compact-dumps', help='convert created ABI dumps to a compact indexed format (ABI.bin), they are exported back to text for abi-compliance-checker when needed', action='store_true')
+    parser.add_argument('-compact-dump', help='convert the text ABI dump PATH to ABI.bin in the same directory, the text dump is kept', metavar='PATH')
+    parser.add_argument('-fail-fast', help='stop at the first ABI break (removed object, changed SONAME, removed exported symbol or binary compatibility problem) and exit with code 14, remaining tasks are cancelled', action='store_true')
+    parser.add_argument('-no-space-check', help='do not check free disk space for extraction and ABI dumps before the run', action='store_true')
+    parser.add_argument('-dry-run', help='print the planned work (extraction, ABI dumps, report) with estimated time and exit', action='store_true')
+    parser.add_argument('-worker-idle', help='stop the worker after SEC seconds without tasks (default: never)', type=int, default=0, metavar='SEC')
     
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def print_err(msg):
     sys.stderr.write(msg+"\n")
+    emit_event("error", message=msg)
+
+def emit_event(event, **data):
+    global EVENTS
+    
+    if not ARGS:
+        return
+    
+    if ARGS.metrics_file:
+        update_metrics(event, data)
+    
+    if not ARGS.events:
+        return
+    
+    if EVENTS is None:
+        if ARGS.events.isdigit():
+            EVENTS = int(ARGS.events)
+        else:
+            EVENTS = os.open(ARGS.events, os.O_WRONLY|os.O_APPEND|os.O_CREAT, 0644)
+    
+    data["event"] = event
+    data["time"] = round(time.time(), 3)
+    data.update(EVENT_TAGS)
+    
+    # one write per line, lines of concurrent processes don't mix
+    os.write(EVENTS, json.dumps(data, sort_keys=True)+"\n")
+
+def inc_metric(name, labels, value=1):
+    key = (name, tuple(sorted(labels.items())))
+    METRICS[key] = METRICS.get(key, 0)+value
+
+def observe_metric(name, labels, value):
+    # cumulative buckets
+    for le in METRIC_BUCKETS+["+Inf"]:
+        inc_metric(name+"_bucket", dict(labels, le=str(le)), int(le=="+Inf" or value<=le))
+    inc_metric(name+"_sum", labels, value)
+    inc_metric(name+"_count", labels)
+
+def update_metrics(event, data):
+    # metrics are collected from progress events
+    if event=="run_start":
+        # not labeled by package, the number of series would grow with
+        # every compared package
+        METRICS_RUN["kind"] = "+".join([k for k in ["bin", "src"] if getattr(ARGS, k)])
+    elif event=="stage_finish":
+        inc_metric("pkg_abidiff_stage_seconds_total", {"stage":data["stage"]}, data["duration"])
+        if data["stage"]=="match":
+            for k in ["mapped", "added", "removed"]:
+                inc_metric("pkg_abidiff_objects_total", {"status":k}, data[k])
+    elif event=="task_finish":
+        kind = {"kind":data["kind"]}
+        observe_metric("pkg_abidiff_task_seconds", kind, data["duration"])
+        if data.get("rss"):
+            key = ("pkg_abidiff_task_max_rss_bytes", tuple(kind.items()))
+            METRICS[key] = max(METRICS.get(key, 0), data["rss"]*1024)
+        if data.get("dwarf"):
+            observe_metric("pkg_abidiff_dump_seconds_per_dwarf_mb", {}, data["duration"]*1024*1024/data["dwarf"])
+        if data.get("bytes"):
+            inc_metric("pkg_abidiff_extracted_bytes_total", {}, data["bytes"])
+    elif event=="cache":
+        inc_metric("pkg_abidiff_cache_total", {"cache":data["cache"], "result":data["hit"] and "hit" or "miss"})
+    elif event=="cache_evict":
+        inc_metric("pkg_abidiff_cache_total", {"cache":data["cache"], "result":"evict"}, data["count"])
+    elif event=="finish":
+        inc_metric("pkg_abidiff_runs_total", {"status":data["status"]})
+        if METRICS_RUN:
+            observe_metric("pkg_abidiff_run_seconds", METRICS_RUN, time.time()-METRICS_START)
+
+def reset_metrics():
+    # forked runs report only their own metrics
+    global METRICS_START
+    METRICS.clear()
+    METRICS_RUN.clear()
+    METRICS_START = time.time()
+
+def get_metric_base(name):
+    if name not in METRIC_TYPES:
+        name = re.sub(r"_(bucket|sum|count)\Z", "", name)
+    return name
+
+def format_metric_labels(labels):
+    if not labels:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{"+",".join([k+"=\""+esc(v)+"\"" for k, v in labels])+"}"
+
+def read_metrics(path):
+    metrics = {}
+    for line in read_file(path).splitlines():
+        m = re.match(r"(\w+)(\{(.*)\})? (\S+)\Z", line)
+        if not m:
+            continue
+        labels = re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(3) or "")
+        labels = [(k, re.sub(r"\\(.)", lambda x: x.group(1)=="n" and "\n" or x.group(1), v)) for k, v in labels]
+        metrics[(m.group(1), tuple(sorted(labels)))] = float(m.group(4))
+    return metrics
+
+def write_metrics():
+    # merged with the metrics of other runs writing to the same file
+    path = os.path.abspath(ARGS.metrics_file)
+    lock = open(path+".lock", "a")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    
+    metrics = {}
+    if os.path.exists(path):
+        metrics = read_metrics(path)
+    
+    for key, value in METRICS.items():
+        merge = METRIC_TYPES[get_metric_base(key[0])][2]
+        if merge=="sum":
+            metrics[key] = metrics.get(key, 0)+value
+        elif merge=="max":
+            metrics[key] = max(metrics.get(key, 0), value)
+        else:
+            metrics[key] = value
+    
+    by_name = {}
+    for key in metrics:
+        by_name.setdefault(get_metric_base(key[0]), []).append(key)
+    
+    # series of a histogram together, buckets in order
+    order = lambda key: ([x for x in key[1] if x[0]!="le"], key[0], [float(v) for k, v in key[1] if k=="le"])
+    
+    content = ""
+    for name in sorted(by_name):
+        if name not in METRIC_TYPES:
+            continue
+        content += "# HELP "+name+" "+METRIC_TYPES[name][1]+"\n"
+        content += "# TYPE "+name+" "+METRIC_TYPES[name][0]+"\n"
+        for key in sorted(by_name[name], key=order):
+            value = metrics[key]
+            if value==int(value):
+                value = int(value)
+            content += key[0]+format_metric_labels(key[1])+" "+repr(value)+"\n"
+    
+    tmp_path = path+".tmp-"+str(os.getpid())
+    write_file(tmp_path, content)
+    os.rename(tmp_path, path)
+    lock.close()
 
 def get_modules():
     tool_path = os.path.realpath(__file__)
@@ -119,29 +383,54 @@ def get_modules():
     s_exit("Error")
 
 def check_cmd(prog):
+    key = ("path", prog)
+    if key in PROBES:
+        return PROBES[key]
+    
+    PROBES[key] = None
     for path in os.environ["PATH"].split(os.pathsep):
         path = path.strip('"')
         candidate = path+"/"+prog
         if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
-            return candidate
+            PROBES[key] = candidate
+            break
     
-    return None
+    return PROBES[key]
 
-def s_exit(code):
+def s_exit(code, keep_tmp=False):
     global TMP_DIR, TMP_DIR_INT, ERROR_CODE
     
-    chmod_777(TMP_DIR_INT)
-    shutil.rmtree(TMP_DIR_INT)
+    kill_tasks()
+    emit_event("finish", status=code, exit=ERROR_CODE[code])
     
-    if not ARGS.tmp_dir:
-        shutil.rmtree(TMP_DIR)
+    if ARGS and ARGS.metrics_file and METRICS:
+        write_metrics()
+    
+    if keep_tmp and JOURNAL and TMP_DIR_INT:
+        print "Use -resume option to continue the run"
+        # extracted packages are kept for runs with -resume only, the
+        # parent removes workspaces of group runs
+        if ARGS.resume and "group" not in EVENT_TAGS:
+            sys.exit(ERROR_CODE[code])
+    
+    if TMP_DIR_INT:
+        chmod_777(TMP_DIR_INT)
+        shutil.rmtree(TMP_DIR_INT)
+        
+        if not ARGS.tmp_dir:
+            shutil.rmtree(TMP_DIR)
     
     sys.exit(ERROR_CODE[code])
 
 def int_exit(signal, frame):
     print "\nGot INT signal"
     print "Exiting"
-    s_exit("Error")
+    s_exit("Error", True)
+
+def cancel_exit(signal, frame):
+    # another group of the run has an ABI break (-fail-fast)
+    print "Cancelled"
+    s_exit("Cancelled")
 
 def exit_status(code, msg):
     if code!="Ok":
@@ -151,7 +440,7 @@ def exit_status(code, msg):
     
     s_exit(code)
 
-def extract_pkgs(age, kind):
+def extract_pkgs(age, kind, members=None):
     global PKGS, TMP_DIR_INT
     pkgs = PKGS[age][kind].keys()
     
@@ -160,6 +449,7 @@ def extract_pkgs(age, kind):
     if not os.path.exists(extr_dir):
         os.makedirs(extr_dir)
     
+    tasks = []
     for pkg in pkgs:
         m = re.match(r".*\.(\w+)\Z", os.path.basename(pkg))
         fmt = None
@@ -172,20 +462,543 @@ def extract_pkgs(age, kind):
         
         pkg_abs = os.path.abspath(pkg)
         
-        os.chdir(extr_dir)
+        task = new_task("extract", None, cwd=os.path.abspath(extr_dir))
+        task["package"] = pkg
+        task["extr_dir"] = os.path.abspath(extr_dir)
+        
+        if ARGS.extract_cache and members is None:
+            # extracted next to the cache entry and moved there
+            entry = get_cache_entry(pkg)
+            lock = lock_cache(fcntl.LOCK_SH)
+            hit = os.path.exists(entry+"/files.json")
+            if hit:
+                # not evicted by other processes within CACHE_GRACE
+                os.utime(entry, None)
+            lock.close()
+            emit_event("cache", cache="extract", package=pkg, hit=hit)
+            if hit:
+                continue
+            
+            task["cwd"] = os.path.abspath(entry+".tmp-"+socket.gethostname()+"-"+str(os.getpid())+"/tree")
+            if os.path.exists(task["cwd"]):
+                shutil.rmtree(task["cwd"])
+            os.makedirs(task["cwd"])
+            task["cache"] = entry
+            task["pkg_kind"] = kind
+            task["deb_debug"] = (kind=="debug" and fmt=="deb")
+            task["done"] = add_to_cache
+        
+        task["cost"] = os.path.getsize(pkg_abs)*DUMP_SEC_PER_BYTE
+        
+        patterns = None
+        if members is not None:
+            # selected files only
+            # tar fails on patterns that are not found
+            patterns = filter_members(pkg, members)
+            if not patterns:
+                continue
+        
+        task["cmd"] = get_extract_cmd(pkg_abs, fmt, patterns)
+        task["members"] = members
+        task["stderr"] = os.path.abspath(TMP_DIR_INT+"/extract-err/"+task["id"])
+        tasks.append(task)
+    
+    return extr_dir, tasks
+
+def filter_members(pkg, members):
+    # patterns found in the package, paths of files (not starting with
+    # a wildcard) get the prefix of member names of the archive
+    files = list_pkg_files(pkg)
+    prefix = get_member_prefix(pkg)
+    
+    selected = []
+    for p in members:
+        exact = not p.startswith("*")
+        if files is not None and not any([match_member(f, p) for f in files]):
+            continue
+        
+        if exact:
+            selected.append(prefix+p)
+        else:
+            selected.append(p)
+    
+    return selected
+
+def match_member(path, pattern):
+    # fnmatch has no backslash escapes
+    pat = re.sub(r"\\(.)", r"[\1]", pattern)
+    if pattern.startswith("*"):
+        return fnmatch.fnmatchcase("/"+path, pat)
+    
+    return fnmatch.fnmatchcase(path, pat)
+
+def get_extracted_size(task):
+    if task.get("cache"):
+        # own tree
+        tree = task["cwd"]
+        return sum([os.lstat(p).st_size for f, p in list_files(tree)])
+    
+    # extracted to the shared directory, sizes of files are listed
+    pkg = task["package"]
+    if list_pkg_files(pkg) is None:
+        return get_pkg_size(pkg)
+    
+    sizes = PROBES[("sizes", os.path.abspath(pkg))]
+    if task["members"] is None:
+        return sum(sizes.values())
+    
+    return sum([sizes[f] for f in sizes if any([match_member(f, p) for p in task["members"]])])
+
+def get_member_prefix(pkg):
+    # "./usr/lib/..." in RPM, DEB and Gentoo packages, "usr/lib/..." in APK
+    key = ("prefix", os.path.abspath(pkg))
+    if PROBES.get(key) is not None:
+        return PROBES[key]
+    
+    if get_fmt(pkg)=="apk":
+        return ""
+    
+    return "./"
+
+def get_payload(path, fmt):
+    # offset, size and compression of the payload of RPM or DEB package
+    key = ("payload", os.path.abspath(path))
+    if key in PROBES:
+        return PROBES[key]
+    
+    PROBES[key] = None
+    name = None
+    size = None
+    with open(path, "rb") as f:
+        if fmt=="rpm":
+            # lead, signature header (aligned to 8 bytes) and header
+            f.seek(96)
+            for align in [8, 1]:
+                hdr = f.read(16)
+                if len(hdr)<16 or hdr[:3]!="\x8e\xad\xe8":
+                    return None
+                nindex, hsize = struct.unpack(">II", hdr[8:16])
+                length = 16*nindex+hsize
+                f.seek(length+(align-length%align)%align, 1)
+        elif fmt=="deb":
+            if f.read(8)!="!<arch>\n":
+                return None
+            while True:
+                hdr = f.read(60)
+                if len(hdr)<60:
+                    return None
+                name = hdr[:16].strip().rstrip("/")
+                if not hdr[48:58].strip().isdigit():
+                    return None
+                size = int(hdr[48:58])
+                if name.startswith("data.tar"):
+                    break
+                f.seek(size+size%2, 1)
+        else:
+            return None
+        
+        offset = f.tell()
+        magic = f.read(6)
+    
+    comp = None
+    if magic.startswith("\xfd7zXZ\x00"):
+        comp = "xz"
+    elif magic.startswith("\x28\xb5\x2f\xfd"):
+        comp = "zstd"
+    elif magic.startswith("\x1f\x8b"):
+        comp = "gzip"
+    elif magic.startswith("BZh"):
+        comp = "bzip2"
+    elif magic.startswith("\x5d\x00\x00"):
+        comp = "lzma"
+    elif fmt=="rpm" and magic.startswith("07070"):
+        comp = "none"
+    elif fmt=="deb" and name=="data.tar":
+        comp = "none"
+    else:
+        return None
+    
+    PROBES[key] = {"offset":offset, "size":size, "name":name, "comp":comp}
+    return PROBES[key]
+
+def get_decompressor(comp):
+    # parallel implementations are preferred, threads are shared by -j tasks
+    threads = str(max(1, os.sysconf("SC_NPROCESSORS_ONLN")/max(ARGS.jobs, 1)))
+    
+    if comp=="none":
+        return "cat"
+    elif comp=="xz" and check_cmd("xz"):
+        # multithreaded decompression since xz 5.4
+        return "xz -dc -T"+threads
+    elif comp=="lzma" and check_cmd("xz"):
+        return "xz -dc --format=lzma"
+    elif comp=="zstd" and check_cmd("zstd"):
+        return "zstd -dc"
+    elif comp=="gzip":
+        if check_cmd("pigz"):
+            return "pigz -dc -p "+threads
+        elif check_cmd("gzip"):
+            return "gzip -dc"
+    elif comp=="bzip2":
+        if check_cmd("lbzip2"):
+            return "lbzip2 -dc -n "+threads
+        elif check_cmd("pbzip2"):
+            return "pbzip2 -dc -p"+threads
+        elif check_cmd("bzip2"):
+            return "bzip2 -dc"
+    
+    return None
+
+def get_extract_cmd(pkg, fmt, patterns=None):
+    # pipelines fail if any of the commands fails
+    if fmt in ("apk", "tbz2", "xpak"):
+        # note: this needs tar that detects compression algo
+        cmd = ["tar", "-xf", pkg]
+        if patterns:
+            cmd.extend(["--wildcards"]+patterns)
+        return cmd
+    
+    if fmt=="deb" and not patterns:
+        cmd = "dpkg-deb --extract "+pipes.quote(pkg)+" ."
+    else:
+        cmd = None
+    
+    payload = get_payload(pkg, fmt)
+    decomp = None
+    if payload:
+        decomp = get_decompressor(payload["comp"])
+    
+    if decomp and fmt=="rpm":
+        cmd = "tail -c +"+str(payload["offset"]+1)+" "+pipes.quote(pkg)+" | "+decomp+" | cpio -id --quiet"
+    elif decomp and fmt=="deb" and check_cmd("ar"):
+        cmd = "ar p "+pipes.quote(pkg)+" "+pipes.quote(payload["name"])+" | "+decomp+" | tar -xf -"
+    elif fmt=="rpm":
+        cmd = "rpm2cpio "+pipes.quote(pkg)+" | cpio -id --quiet"
+    elif cmd is None:
+        cmd = "dpkg-deb --fsys-tarfile "+pipes.quote(pkg)+" | tar -xf -"
+    
+    if patterns:
+        if fmt=="deb":
+            cmd += " --wildcards"
+        cmd += " "+" ".join([pipes.quote(p) for p in patterns])
+    
+    return ["bash", "-o", "pipefail", "-c", cmd]
+
+def get_pkg_hash(path):
+    st = os.stat(path)
+    key = ("sha256", os.path.abspath(path), st.st_mtime, st.st_size)
+    if key not in PROBES:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024*1024), ""):
+                h.update(chunk)
+        PROBES[key] = h.hexdigest()
+    return PROBES[key]
+
+def get_cache_entry(pkg):
+    return ARGS.extract_cache+"/"+get_pkg_hash(pkg)
+
+def is_identical(kind):
+    if kind not in PKGS["old"] or kind not in PKGS["new"]:
+        return False
+    
+    hashes = {}
+    for age in ["old", "new"]:
+        hashes[age] = sorted([get_pkg_hash(pkg) for pkg in PKGS[age][kind]])
+    
+    return hashes["old"]==hashes["new"]
+
+def get_pkg_size(path):
+    # installed size of the package payload in bytes
+    key = ("size", os.path.abspath(path))
+    if key in PROBES:
+        return PROBES[key]
+    
+    fmt = get_fmt(path)
+    size = None
+    try:
+        err_log = open(os.devnull, "w")
         if fmt=="rpm":
-            subprocess.call("rpm2cpio \""+pkg_abs+"\" | cpio -id --quiet", shell=True)
+            r = subprocess.check_output(["rpm", "-qp", "--queryformat", "%{LONGSIZE}", path], stderr=err_log)
+            if not r.isdigit():
+                r = subprocess.check_output(["rpm", "-qp", "--queryformat", "%{SIZE}", path], stderr=err_log)
+            size = int(r)
         elif fmt=="deb":
-            subprocess.call(["dpkg-deb", "--extract", pkg_abs, "."])
+            r = subprocess.check_output(["dpkg-deb", "--field", path, "Installed-Size"], stderr=err_log)
+            size = int(r.strip())*1024
         elif fmt=="apk":
-            with open(TMP_DIR_INT+"/err", "a") as err_log:
-                subprocess.call(["tar", "-xf", pkg_abs], stderr=err_log)
+            r = subprocess.check_output(["tar", "-xf", path, ".PKGINFO", "-O"], stderr=err_log)
+            m = re.search(r"^size\s*=\s*(\d+)", r, re.M)
+            if m:
+                size = int(m.group(1))
         elif fmt in ("tbz2", "xpak"):
-            # note: this needs tar that detects compression algo
-            subprocess.call(["tar", "-xf", pkg_abs])
-        os.chdir(ORIG_DIR)
+            import portage.xpak
+            size = int(portage.xpak.tbz2(path).get_data()["SIZE"].strip())
+        err_log.close()
+    except (OSError, subprocess.CalledProcessError, ValueError, ImportError, KeyError):
+        pass
+    
+    if not size:
+        # compressed payloads are usually 3-4 times smaller
+        size = 4*os.path.getsize(path)
+    
+    PROBES[key] = size
+    return size
+
+def get_free_space(path):
+    # free space and device of the file system of a path or its nearest
+    # existing parent
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    
+    st = os.statvfs(path)
+    return st.f_bavail*st.f_frsize, os.stat(path).st_dev
+
+def check_space(plan):
+    # fail in seconds instead of running out of space after an hour
+    global TMP_DIR, TMP_DIR_INT
+    
+    dumps_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dumps_dir = ARGS.dumps_dir
+    
+    extr_dir = TMP_DIR
+    if ARGS.extract_cache:
+        extr_dir = ARGS.extract_cache
+    
+    # packages extracted by the interrupted run are in its workspace
+    extract_size = 0
+    resumed = False
+    for age, kind, pkg, size in plan["space"]["pkgs"]:
+        if journal_has("extract", os.path.abspath(TMP_DIR_INT+"/ext/"+age+"/"+kind)+"/"+pkg):
+            resumed = True
+        else:
+            extract_size += size
+    
+    def get_need(extr_dir):
+        need = {}
+        for path, size in [(extr_dir, extract_size), (dumps_dir, plan["space"]["dumps"])]:
+            free, dev = get_free_space(path)
+            if dev not in need:
+                need[dev] = {"size":0, "free":free, "paths":[]}
+            need[dev]["size"] += size
+            need[dev]["paths"].append(path)
+        return need
+    
+    need = get_need(extr_dir)
+    free, dev = get_free_space(extr_dir)
+    
+    if need[dev]["size"]>need[dev]["free"] and extr_dir==TMP_DIR and not ARGS.tmp_dir and not ARGS.queue_dir and not resumed:
+        # another workspace, the default one may be a small tmpfs
+        for base in [tempfile.gettempdir(), "/var/tmp"]:
+            if not os.path.isdir(base) or not os.access(base, os.W_OK):
+                continue
+            
+            c_need = get_need(base)
+            c_free, c_dev = get_free_space(base)
+            if c_need[c_dev]["size"]<=c_need[c_dev]["free"]:
+                print "Not enough free space in "+TMP_DIR+", using "+base
+                shutil.rmtree(TMP_DIR)
+                TMP_DIR = tempfile.mkdtemp(dir=base)
+                TMP_DIR_INT = TMP_DIR+"/PKG_ABIDIFF_TMP"
+                os.makedirs(TMP_DIR_INT)
+                journal_add("workspace", "tmp", TMP_DIR)
+                need = c_need
+                break
+    
+    for dev in need:
+        if need[dev]["size"]>need[dev]["free"]:
+            exit_status("Error", "not enough free space for "+" and ".join(need[dev]["paths"])+": "+format_size(need[dev]["size"])+" needed, "+format_size(need[dev]["free"])+" available (use -no-space-check to skip this check)")
+
+def format_size(size):
+    return format_num(float(size)/(1024*1024))+" MB"
+
+def list_pkg_files(path):
+    # regular files of a package, read without extracting it
+    key = ("list", os.path.abspath(path))
+    if key in PROBES:
+        return PROBES[key]
+    
+    fmt = get_fmt(path)
+    if fmt=="rpm":
+        cmd = ["rpm", "-qp", "--queryformat", "[%{FILEMODES:perms} %{FILESIZES} %{FILENAMES}\n]", path]
+    elif fmt=="deb":
+        cmd = ["dpkg-deb", "--contents", path]
+    else:
+        cmd = ["tar", "-tvf", path]
+    
+    PROBES[key] = None
+    try:
+        err_log = open(os.devnull, "w")
+        out = subprocess.check_output(cmd, stderr=err_log)
+        err_log.close()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    
+    files = []
+    sizes = {}
+    for line in out.splitlines():
+        if fmt=="rpm":
+            m = re.match(r"(\S+) (\d+) (.+)\Z", line)
+        else:
+            m = re.match(r"(\S+)\s+\S+\s+(\d+)\s+\S+\s+\S+\s+(.+)\Z", line)
+        if m and m.group(1).startswith("-"):
+            if fmt!="rpm" and ("prefix", key[1]) not in PROBES:
+                PROBES[("prefix", key[1])] = re.match(r"(\.?/)?", m.group(3)).group(0)
+            name = re.sub(r"\A\.?/", "", m.group(3))
+            files.append(name)
+            sizes[name] = int(m.group(2))
+    
+    PROBES[("sizes", key[1])] = sizes
+    PROBES[key] = files
+    return files
+
+def lock_cache(mode):
+    # shared for adding and linking entries, exclusive for eviction
+    if not os.path.exists(ARGS.extract_cache):
+        try:
+            os.makedirs(ARGS.extract_cache)
+        except OSError:
+            pass
+    
+    f = open(ARGS.extract_cache+"/lock", "a")
+    fcntl.flock(f, mode)
+    return f
+
+def add_to_cache(task):
+    tree = task["cwd"]
+    tmp = os.path.dirname(tree)
+    
+    if not is_failed(task):
+        res = scan_files(task["pkg_kind"], tree, task["deb_debug"])
+        info = {"package":os.path.basename(task["package"]), "kind":task["pkg_kind"], "count":res["count"]}
+        for k in ["object", "debuginfo", "header"]:
+            info[k] = [p[len(tree)+1:] for p in res[k]]
+        info["size"] = sum([os.lstat(p).st_size for f, p in list_files(tree)])
+        write_file(tmp+"/files.json", json.dumps(info))
+        
+        lock = lock_cache(fcntl.LOCK_SH)
+        try:
+            os.rename(tmp, task["cache"])
+        except OSError:
+            # added by another process
+            pass
+        lock.close()
+    
+    if os.path.exists(tmp):
+        chmod_777(tmp)
+        shutil.rmtree(tmp)
+
+def link_tree(src, dst):
+    # hard links if possible, copies (reflinks on CoW filesystems) otherwise
+    if os.stat(src).st_dev!=os.stat(dst).st_dev:
+        if subprocess.call(["cp", "-a", "--reflink=auto", src+"/.", dst]):
+            exit_status("Error", "failed to copy "+src)
+        return
+    
+    for root, dirs, files in os.walk(src):
+        rel = root[len(src):]
+        for name in dirs+files:
+            path = dst+rel+"/"+name
+            if os.path.lexists(path):
+                continue
+            
+            if os.path.islink(root+"/"+name):
+                os.symlink(os.readlink(root+"/"+name), path)
+            elif name in dirs:
+                os.mkdir(path)
+            else:
+                os.link(root+"/"+name, path)
+
+def link_from_cache(age, kind, e_dir):
+    global FILES
+    
+    rescan = False
+    count = 0
+    found = {"object":[], "debuginfo":[], "header":[]}
+    missing = []
+    
+    lock = lock_cache(fcntl.LOCK_SH)
+    for pkg in sorted(PKGS[age][kind].keys()):
+        entry = get_cache_entry(pkg)
+        if not os.path.exists(entry+"/files.json"):
+            missing.append(pkg)
+            continue
+        
+        info = json.loads(read_file(entry+"/files.json"))
+        link_tree(entry+"/tree", e_dir)
+        os.utime(entry, None)
+        
+        if info["kind"]!=kind:
+            rescan = True
+        
+        for k in found:
+            found[k].extend([e_dir+"/"+p for p in info[k]])
+        count += info["count"]
+    lock.close()
+    
+    # evicted by another process since the lookup
+    tasks = []
+    for pkg in missing:
+        print "WARNING: "+os.path.basename(pkg)+" is removed from the extraction cache, extracting"
+        task = new_task("extract", get_extract_cmd(os.path.abspath(pkg), get_fmt(pkg)), cwd=os.path.abspath(e_dir))
+        task["package"] = pkg
+        task["stderr"] = os.path.abspath(TMP_DIR_INT+"/extract-err/"+task["id"])
+        tasks.append(task)
+        rescan = True
+    
+    for task in run_tasks(tasks):
+        if is_failed(task):
+            exit_status("Error", "failed to extract package "+task["package"]+" ("+get_task_error(task)+")")
+    
+    if rescan:
+        # files of other kinds of the age are kept
+        classify_files(age, kind, e_dir)
+    else:
+        for k in found:
+            FILES[age][k].extend(found[k])
+        FILES[age]["count"][kind] = count
+
+def evict_cache():
+    # least recently used entries first, recently used ones may be
+    # linked by other processes
+    limit = ARGS.extract_cache_size*1024*1024
+    
+    lock = lock_cache(fcntl.LOCK_EX)
+    entries = []
+    total = 0
+    for name in os.listdir(ARGS.extract_cache):
+        path = ARGS.extract_cache+"/"+name
+        if not os.path.isdir(path):
+            continue
+        
+        mtime = os.path.getmtime(path)
+        if name.find(".tmp-")!=-1:
+            # left by killed runs
+            if time.time()-mtime>CACHE_GRACE:
+                chmod_777(path)
+                shutil.rmtree(path)
+            continue
+        
+        if os.path.exists(path+"/files.json"):
+            size = json.loads(read_file(path+"/files.json"))["size"]
+            entries.append((mtime, path, size))
+            total += size
+    
+    entries.sort()
+    evicted = 0
+    for mtime, path, size in entries:
+        if total<=limit or time.time()-mtime<CACHE_GRACE:
+            break
+        chmod_777(path)
+        shutil.rmtree(path)
+        total -= size
+        evicted += 1
+    lock.close()
     
-    return extr_dir
+    if evicted:
+        emit_event("cache_evict", cache="extract", count=evicted)
 
 def get_rel_path(path):
     global TMP_DIR_INT
@@ -194,18 +1007,300 @@ def get_rel_path(path):
     return path
 
 def is_object(path):
-    name = os.path.basename(path)
-    if re.search(r"lib.*\.so(\..+|\Z)", name):
-        if read_bytes(path)=="7f454c46":
+    if is_object_name(os.path.basename(path)):
+        if is_elf(path):
             return True
     return False
 
+def is_object_name(name):
+    if re.search(r"lib.*\.so(\..+|\Z)", name):
+        return True
+    
+    return False
+
+def is_elf(path):
+    return read_bytes(path)=="7f454c46"
+
+def read_elf(path):
+    elf = {"sections":[]}
+    f = open(path, "rb")
+    
+    ident = f.read(16)
+    if len(ident)<16 or ident[0:4]!="\x7fELF":
+        f.close()
+        return None
+    
+    if ident[5]=="\x02":
+        elf["endian"] = ">"
+    else:
+        elf["endian"] = "<"
+    
+    if ident[4]=="\x02":
+        elf["bits"] = 64
+        ehdr = elf["endian"]+"HHIQQQIHHHHHH"
+        shdr = elf["endian"]+"IIQQQQIIQQ"
+        chdr = elf["endian"]+"IIQ"
+    else:
+        elf["bits"] = 32
+        ehdr = elf["endian"]+"HHIIIIIHHHHHH"
+        shdr = elf["endian"]+"IIIIIIIIII"
+        chdr = elf["endian"]+"II"
+    
+    e = struct.unpack(ehdr, f.read(struct.calcsize(ehdr)))
+    shoff, shentsize, shnum, shstrndx = e[5], e[10], e[11], e[12]
+    
+    if not shoff or not shnum or shstrndx>=shnum:
+        f.close()
+        return elf
+    
+    f.seek(shoff)
+    raw = f.read(shentsize*shnum)
+    
+    for i in range(0, shnum):
+        sh = struct.unpack(shdr, raw[i*shentsize:i*shentsize+struct.calcsize(shdr)])
+        elf["sections"].append({"name":sh[0], "type":sh[1], "flags":sh[2], "offset":sh[4], "size":sh[5], "link":sh[6], "entsize":sh[9]})
+    
+    strtab = elf["sections"][shstrndx]
+    f.seek(strtab["offset"])
+    names = f.read(strtab["size"])
+    
+    for sec in elf["sections"]:
+        sec["name"] = names[sec["name"]:names.find("\0", sec["name"])]
+        
+        # SHF_COMPRESSED
+        if sec["flags"] & 0x800:
+            f.seek(sec["offset"])
+            sec["size"] = struct.unpack(chdr, f.read(struct.calcsize(chdr)))[-1]
+    
+    f.close()
+    return elf
+
+def get_dwarf_size(path):
+    elf = read_elf(path)
+    size = 0
+    if elf:
+        for sec in elf["sections"]:
+            if sec["name"].startswith(".debug_") or sec["name"].startswith(".zdebug_"):
+                size += sec["size"]
+    return size
+
+def get_build_id(path):
+    elf = read_elf(path)
+    if not elf:
+        return None
+    
+    for sec in elf["sections"]:
+        if sec["name"]==".note.gnu.build-id":
+            with open(path, "rb") as f:
+                f.seek(sec["offset"])
+                namesz, descsz, ntype = struct.unpack(elf["endian"]+"III", f.read(12))
+                f.read((namesz+3)&~3)
+                return binascii.b2a_hex(f.read(descsz))
+    
+    return None
+
+def get_dynsym(path):
+    # names of defined global symbols with default or protected visibility
+    elf = read_elf(path)
+    symbols = set()
+    if not elf:
+        return symbols
+    
+    if elf["bits"]==64:
+        sym = elf["endian"]+"IBBHQQ"
+    else:
+        sym = elf["endian"]+"IIIBBH"
+    
+    for sec in elf["sections"]:
+        if sec["name"]!=".dynsym" or sec["link"]>=len(elf["sections"]):
+            continue
+        
+        strtab = elf["sections"][sec["link"]]
+        entsize = sec["entsize"] or struct.calcsize(sym)
+        
+        with open(path, "rb") as f:
+            f.seek(strtab["offset"])
+            names = f.read(strtab["size"])
+            f.seek(sec["offset"])
+            raw = f.read(sec["size"])
+        
+        for i in range(0, len(raw)/entsize):
+            s = struct.unpack(sym, raw[i*entsize:i*entsize+struct.calcsize(sym)])
+            if elf["bits"]==64:
+                name, info, other, shndx = s[0], s[1], s[2], s[3]
+            else:
+                name, info, other, shndx = s[0], s[3], s[4], s[5]
+            
+            # undefined, local, file and section symbols, absolute symbols
+            # (names of version definitions, e.g. LIBMNL_1.0)
+            if not name or not shndx or shndx==0xfff1 or info>>4 not in (1, 2, 10) or info&0xf in (3, 4):
+                continue
+            
+            if other&0x3 in (1, 2):
+                continue
+            
+            symbols.add(names[name:names.find("\0", name)])
+    
+    return symbols
+
+def get_minhash(symbols):
+    hashes = [int(hashlib.md5(s).hexdigest()[:8], 16) for s in symbols]
+    return [min([(a*h+b)%MINHASH_PRIME for h in hashes]) for a, b in MINHASH_PERMS]
+
+def match_by_symbols(old, new, threshold):
+    # old and new are maps from object names to sets of exported symbols,
+    # returns pairs of objects with the similarity of their symbols
+    buckets = {}
+    for obj in new:
+        if not new[obj]:
+            continue
+        sig = get_minhash(new[obj])
+        for band in range(0, MINHASH_N/LSH_ROWS):
+            key = (band, tuple(sig[band*LSH_ROWS:(band+1)*LSH_ROWS]))
+            buckets.setdefault(key, set()).add(obj)
+    
+    pairs = []
+    for obj in old:
+        if not old[obj]:
+            continue
+        sig = get_minhash(old[obj])
+        candidates = set()
+        for band in range(0, MINHASH_N/LSH_ROWS):
+            key = (band, tuple(sig[band*LSH_ROWS:(band+1)*LSH_ROWS]))
+            candidates.update(buckets.get(key, []))
+        
+        for new_obj in candidates:
+            sim = float(len(old[obj] & new[new_obj]))/len(old[obj] | new[new_obj])
+            if sim>=threshold:
+                pairs.append((sim, obj, new_obj))
+    
+    # most similar first, one pair per object
+    pairs.sort(key=lambda x: (-x[0], x[1], x[2]))
+    
+    matched = {}
+    matched_r = {}
+    for sim, obj, new_obj in pairs:
+        if obj not in matched and new_obj not in matched_r:
+            matched[obj] = (new_obj, sim)
+            matched_r[new_obj] = obj
+    
+    return matched
+
+def find_break(mapped, removed, soname, obj_path):
+    # cheap signals of an ABI break, before objects are dumped
+    for obj in sorted(removed):
+        return "object "+obj+" is removed"
+    
+    for obj in sorted(mapped):
+        new_obj = mapped[obj]
+        old_soname = soname["old"][obj]
+        new_soname = soname["new"][new_obj]
+        if old_soname and new_soname and old_soname!=new_soname:
+            return "SONAME of "+obj+" is changed from "+old_soname+" to "+new_soname
+    
+    for obj in sorted(mapped):
+        new_obj = mapped[obj]
+        gone = get_dynsym(obj_path["old"][obj])-get_dynsym(obj_path["new"][new_obj])
+        if gone:
+            return str(len(gone))+" exported symbol(s) of "+obj+" are removed, e.g. "+sorted(gone)[0]
+    
+    return None
+
+def get_break_rank(old, new):
+    # objects with more changes are compared first, identical objects last
+    if get_pkg_hash(old)==get_pkg_hash(new):
+        return 0.0
+    
+    added = get_dynsym(new)-get_dynsym(old)
+    old_size = os.path.getsize(old)
+    new_size = os.path.getsize(new)
+    
+    return 1.0+len(added)+abs(new_size-old_size)/float(max(old_size, 1))
+
+def check_break(obj, res):
+    for kind, label in [("bin", "BC"), ("src", "SC")]:
+        if kind in res and float(res[kind]["affected"])>0:
+            print "ABI break: "+label+" of "+obj+" is "+format_num(100-float(res[kind]["affected"]))+"%"
+            s_exit("Break")
+
 def is_header(name):
     if re.search(r"\.(h|hh|hp|hxx|hpp|h\+\+|tcc)\Z", name):
         return True
     
     return False
 
+def list_files(top):
+    # regular files only, symlinks are not followed
+    dirs = [top]
+    while dirs:
+        d = dirs.pop()
+        if scandir is not None:
+            for entry in scandir(d):
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.name, entry.path
+        else:
+            for name in os.listdir(d):
+                path = d+"/"+name
+                mode = os.lstat(path).st_mode
+                if stat.S_ISDIR(mode):
+                    dirs.append(path)
+                elif stat.S_ISREG(mode):
+                    yield name, path
+
+def scan_files(kind, e_dir, deb_debug):
+    res = {"object":[], "debuginfo":[], "header":[], "count":0}
+    
+    for f, fpath in list_files(e_dir):
+        res["count"] += 1
+        
+        if kind=="rel":
+            if is_object_name(f) and is_elf(fpath):
+                res["object"].append(fpath)
+        elif kind=="debug":
+            if f.endswith(".debug"):
+                res["debuginfo"].append(fpath)
+            elif deb_debug and is_object_name(f) and is_elf(fpath):
+                res["debuginfo"].append(fpath)
+        elif kind=="devel":
+            if is_header(f) or fpath.find("/include/", len(e_dir))!=-1:
+                res["header"].append(fpath)
+    
+    return res
+
+def scan_listed(kind, files, deb_debug):
+    # the same as scan_files, by names of listed files
+    res = {"object":[], "debuginfo":[], "header":[]}
+    
+    for fpath in files:
+        f = os.path.basename(fpath)
+        
+        if kind=="rel":
+            if is_object_name(f):
+                res["object"].append(fpath)
+        elif kind=="debug":
+            if f.endswith(".debug") or (deb_debug and is_object_name(f)):
+                res["debuginfo"].append(fpath)
+        elif kind=="devel":
+            if is_header(f) or ("/"+fpath).find("/include/")!=-1:
+                res["header"].append(fpath)
+    
+    return res
+
+def classify_files(age, kind, e_dir):
+    global FILES
+    
+    deb_debug = False
+    if kind=="debug":
+        deb_debug = (get_fmt(PKGS[age]["debug"].keys()[0])=="deb")
+    
+    res = scan_files(kind, e_dir, deb_debug)
+    for k in ["object", "debuginfo", "header"]:
+        FILES[age][k].extend(res[k])
+    
+    FILES[age]["count"][kind] = res["count"]
+
 def get_fmt(path):
     m = re.match(r".*\.([^\.]+)\Z", path)
     if m:
@@ -267,6 +1362,14 @@ def get_attrs(path):
     
     return None
 
+def get_pkg_kind(fname):
+    if re.match(r".*-(headers-|devel-|dev-|dev_).*", fname):
+        return "devel"
+    elif re.match(r".*-(debuginfo-|dbg[_\-]|dbgsym_).*", fname):
+        return "debug"
+    
+    return "rel"
+
 def get_soname(path):
     r = subprocess.check_output(["objdump", "-p", path])
     m = re.search(r"SONAME\s+([^ ]+)", r)
@@ -326,34 +1429,558 @@ def read_stat(path, rdir):
     
     return stat
 
-def compose_html_head(title, keywords, description):
-    styles = read_file(MOD_DIR+"/Internals/Styles/Report.css")
-    
-    cnt =  "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0 Transitional//EN\" \"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd\">\n"
-    cnt += "<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"en\" lang=\"en\">\n"
-    cnt += "<head>\n"
-    cnt += "<meta http-equiv=\"Content-Type\" content=\"text/html; charset=utf-8\" />\n"
-    cnt += "<meta name=\"keywords\" content=\""+keywords+"\" />\n"
-    cnt += "<meta name=\"description\" content=\""+description+"\" />\n\n"
+HTML_TMPL = {}
 
-    cnt += "<title>\n"
-    cnt += "    "+title+"\n"
-    cnt += "</title>\n\n"
-    
-    cnt += "<style type=\"text/css\">\n"
-    cnt += styles
-    cnt += "</style>\n"
+HTML_TMPL["head"] = """<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+<meta name="keywords" content="%(keywords)s" />
+<meta name="description" content="%(description)s" />
 
-    cnt += "</head>\n"
-    
-    return cnt
+<title>
+    %(title)s
+</title>
 
-def get_bc_class(rate, total):
-    cclass = "ok"
-    if float(rate)==100:
-        if total:
-            cclass = "warning"
-    else:
+<style type="text/css">
+"""
+
+HTML_TMPL["body"] = """</style>
+</head>
+<body>
+"""
+
+HTML_TMPL["test_info"] = """<h2>Test Info</h2>
+<table class='summary'>
+<tr>
+<th class='left'>Package</th><td class='right'>%(name)s</td>
+</tr>
+<tr>
+<th class='left'>Old Version</th><td class='right'>%(v1)s</td>
+</tr>
+<tr>
+<th class='left'>New Version</th><td class='right'>%(v2)s</td>
+</tr>
+<tr>
+<th class='left'>Arch</th><td class='right'>%(arch)s</td>
+</tr>
+<tr>
+<th class='left'>Subject</th><td class='right'>%(subject)s</td>
+</tr>
+</table>
+"""
+
+HTML_TMPL["packages"] = """<h2>Packages</h2>
+<table class='summary'>
+<tr>
+<th>Old</th><th>New</th><th title='*.so, *.debug and header files'>Files</th>
+</tr>
+"""
+
+HTML_TMPL["objects_bin_src"] = """<h2>Shared Objects</h2>
+<table class='summary'>
+<tr>
+<th rowspan='2'>Object</th>
+<th colspan='2'>Compatibility</th>
+<th rowspan='2'>Added<br/>Symbols</th>
+<th rowspan='2'>Removed<br/>Symbols</th>
+<th rowspan='2'>Total<br/>Symbols</th>
+</tr>
+<tr>
+<th title='Binary compatibility'>BC</th>
+<th title='Source compatibility'>SC</th>
+</tr>
+"""
+
+HTML_TMPL["objects"] = """<h2>Shared Objects</h2>
+<table class='summary'>
+<tr>
+<th>Object</th>
+<th>%(kind)s<br/>Compatibility</th>
+<th>Added<br/>Symbols</th>
+<th>Removed<br/>Symbols</th>
+<th>Total<br/>Symbols</th>
+</tr>
+"""
+
+HTML_TMPL["multiarch_info"] = """<h2>Test Info</h2>
+<table class='summary'>
+<tr>
+<th class='left'>Package</th><td class='right'>%(name)s</td>
+</tr>
+<tr>
+<th class='left'>Old Version</th><td class='right'>%(v1)s</td>
+</tr>
+<tr>
+<th class='left'>New Version</th><td class='right'>%(v2)s</td>
+</tr>
+<tr>
+<th class='left'>Arches</th><td class='right'>%(arches)s</td>
+</tr>
+</table>
+"""
+
+HTML_TMPL["multiarch_arches"] = """<h2>Architectures</h2>
+<table class='summary'>
+<tr>
+<th>Arch</th>
+<th>Compatibility</th>
+<th>Added<br/>Symbols</th>
+<th>Removed<br/>Symbols</th>
+<th>Removed<br/>Objects</th>
+</tr>
+"""
+
+HTML_TMPL["repo_info"] = """<h2>Test Info</h2>
+<table class='summary'>
+<tr>
+<th class='left'>Old Repository</th><td class='right'>%(old)s</td>
+</tr>
+<tr>
+<th class='left'>New Repository</th><td class='right'>%(new)s</td>
+</tr>
+<tr>
+<th class='left'>Unchanged<br/>Packages</th><td class='right'>%(unchanged)s</td>
+</tr>
+</table>
+"""
+
+HTML_TMPL["repo_packages"] = """<h2>Packages</h2>
+<table class='summary'>
+<tr>
+<th>Package</th>
+<th>Arch</th>
+<th>Old<br/>Version</th>
+<th>New<br/>Version</th>
+<th>Compatibility</th>
+</tr>
+"""
+
+HTML_TMPL["footer"] = """</table>
+<br/>
+<br/>
+<hr/>
+<div class='footer' align='right'><i>Generated by <a href='https://github.com/lvc/pkg-abidiff'>Package ABI Diff</a> %(version)s &#160;</i></div>
+<br/>
+
+</body>
+</html>
+"""
+
+def write_html_report(path, model):
+    n1 = model["name1"]
+    n2 = model["name2"]
+    v1 = model["ver1"]
+    v2 = model["ver2"]
+    
+    if n1==n2:
+        title = n1+": API/ABI report between "+v1+" and "+v2+" versions"
+        keywords = n1+", API, ABI, changes, compatibility, report"
+        desc = "API/ABI compatibility report between "+v1+" and "+v2+" versions of the "+n1
+        h1 = " for "+n1+": <u>"+v1+"</u> vs <u>"+v2+"</u>"
+    else:
+        title = "API/ABI report between "+n1+"-"+v1+" and "+n2+"-"+v2+" packages"
+        keywords = n1+", "+n2+", API, ABI, changes, compatibility, report"
+        desc = "API/ABI compatibility report between "+n1+"-"+v1+" and "+n2+"-"+v2+" packages"
+        h1 = " for <u>"+n1+"-"+v1+"</u> vs <u>"+n2+"-"+v2+"</u>"
+    
+    if not model["bin"]:
+        h1 += " (source compatibility)"
+    
+    f = open(path, "w")
+    
+    f.write(HTML_TMPL["head"] % {"title":title, "keywords":keywords, "description":desc})
+    with open(MOD_DIR+"/Internals/Styles/Report.css", "r") as css:
+        shutil.copyfileobj(css, f)
+    f.write(HTML_TMPL["body"])
+    
+    f.write("<h1>ABI report"+h1+"</h1>\n")
+    
+    if model["public_abi"]:
+        subject = "Public ABI"
+    else:
+        subject = "Public ABI +<br/>Private ABI"
+    
+    if model["objects_only"] or model["objects_skip"]:
+        subset = []
+        if model["objects_only"]:
+            subset.append(", ".join(model["objects_only"].split(";")))
+        if model["objects_skip"]:
+            subset.append("except "+", ".join(model["objects_skip"].split(";")))
+        subject += "<br/>(objects "+" ".join(subset)+" only)"
+    
+    f.write(HTML_TMPL["test_info"] % {"name":n1, "v1":v1, "v2":v2, "arch":model["arch"], "subject":subject})
+    
+    f.write("<h2>Test Result</h2>\n")
+    f.write("<span class='result'>\n")
+    if model["bin"]:
+        f.write("Binary compatibility: <span class='"+get_bc_class(model["bc_eff"], model["problems"])+"' title='Avg. binary compatibility rate'>"+model["bc_eff"]+"%</span>\n")
+        if model["changed_soname"]:
+            f.write(" (<span class='incompatible' title='Effective binary compatibility is "+model["bc_eff"]+"%"+" due to changed SONAME'>changed SONAME</span>)")
+        f.write("<br/>\n")
+    
+    if model["src"]:
+        f.write("Source compatibility: <span class='"+get_bc_class(model["bc_src"], model["problems_src"])+"' title='Avg. source compatibility rate'>"+model["bc_src"]+"%</span>\n")
+        f.write("<br/>\n")
+    
+    f.write("</span>\n")
+    
+    f.write(HTML_TMPL["packages"])
+    for p in model["packages"]:
+        total = len(p["old"])
+        for i in range(0, total):
+            f.write("<tr>\n")
+            f.write("<td class='object'>"+p["old"][i]+"</td>\n")
+            f.write("<td class='object'>"+p["new"][i]+"</td>\n")
+            if i==0:
+                if total>1:
+                    f.write("<td class='center' rowspan='"+str(total)+"'>")
+                else:
+                    f.write("<td class='center'>")
+                f.write(str(p["files"])+"</td>\n")
+            f.write("</tr>\n")
+    f.write("</table>\n")
+    
+    cols = 5
+    if model["bin"] and model["src"]:
+        f.write(HTML_TMPL["objects_bin_src"])
+    else:
+        cols -= 1
+        if model["bin"]:
+            f.write(HTML_TMPL["objects"] % {"kind":"Binary"})
+        else:
+            f.write(HTML_TMPL["objects"] % {"kind":"Source"})
+    
+    for row in model["objects"]:
+        f.write(get_html_row(row, model, cols))
+    
+    f.write(HTML_TMPL["footer"] % {"version":TOOL_VERSION})
+    f.close()
+
+def write_multiarch_html(path, summary, arches):
+    n = summary["Package"]
+    v1 = summary["Version1"]
+    v2 = summary["Version2"]
+    
+    title = n+": API/ABI report between "+v1+" and "+v2+" versions for "+", ".join(arches)
+    keywords = n+", API, ABI, changes, compatibility, report, "+", ".join(arches)
+    desc = "API/ABI compatibility report between "+v1+" and "+v2+" versions of the "+n+" for "+", ".join(arches)
+    
+    f = open(path, "w")
+    
+    f.write(HTML_TMPL["head"] % {"title":title, "keywords":keywords, "description":desc})
+    with open(MOD_DIR+"/Internals/Styles/Report.css", "r") as css:
+        shutil.copyfileobj(css, f)
+    f.write(HTML_TMPL["body"])
+    
+    f.write("<h1>ABI report for "+n+": <u>"+v1+"</u> vs <u>"+v2+"</u></h1>\n")
+    f.write(HTML_TMPL["multiarch_info"] % {"name":n, "v1":v1, "v2":v2, "arches":", ".join(arches)})
+    
+    f.write(HTML_TMPL["multiarch_arches"])
+    for arch in arches:
+        a = summary["Arches"][arch]
+        f.write("<tr>\n<td class='object'>"+arch+"</td>\n")
+        if a.get("Status")=="cancelled":
+            f.write("<td colspan='4'>Cancelled</td>\n</tr>\n")
+            continue
+        
+        if "Report" not in a:
+            f.write("<td colspan='4' class='failed'>N/A: exit code "+str(a["Exit"])+"</td>\n</tr>\n")
+            continue
+        
+        bc = a.get("BC", a.get("Source_BC"))
+        f.write("<td class='"+get_bc_class(bc, 0)+"'><a href='"+a["Report"]+"'>"+str(bc)+"%</a></td>\n")
+        for k in ["Added", "Removed", "ObjectsRemoved"]:
+            f.write("<td>"+str(a[k])+"</td>\n")
+        f.write("</tr>\n")
+    f.write("</table>\n")
+    
+    f.write("<h2>Shared Objects</h2>\n")
+    f.write("<table class='summary'>\n<tr>\n<th>Object</th>\n")
+    for arch in arches:
+        f.write("<th>"+arch+"</th>\n")
+    f.write("</tr>\n")
+    
+    for o in summary["Objects"]:
+        name = o["Object"]
+        if o["ArchSpecific"]:
+            name += "<br/><br/><span class='incompatible'>(arch-specific changes)</span>"
+        f.write("<tr>\n<td class='object'>"+name+"</td>\n")
+        for arch in arches:
+            res = o["Arches"].get(arch)
+            if arch in o["Missing"]:
+                f.write("<td class='failed'>Missing</td>\n")
+            elif res is None:
+                f.write("<td>-</td>\n")
+            elif res["Status"]=="compared":
+                f.write("<td class='"+get_bc_class(res["BC"], 0)+"'><a href='"+res["Report"]+"'>"+str(res["BC"])+"%</a></td>\n")
+            elif res["Status"]=="removed":
+                f.write("<td class='removed'>Removed</td>\n")
+            else:
+                f.write("<td class='failed'>N/A</td>\n")
+        f.write("</tr>\n")
+    
+    f.write(HTML_TMPL["footer"] % {"version":TOOL_VERSION})
+    f.close()
+
+def write_repo_html(path, meta):
+    title = "API/ABI report between "+meta["OldRepo"]+" and "+meta["NewRepo"]+" repositories"
+    keywords = "API, ABI, changes, compatibility, report, repository"
+    
+    f = open(path, "w")
+    
+    f.write(HTML_TMPL["head"] % {"title":title, "keywords":keywords, "description":title})
+    with open(MOD_DIR+"/Internals/Styles/Report.css", "r") as css:
+        shutil.copyfileobj(css, f)
+    f.write(HTML_TMPL["body"])
+    
+    f.write("<h1>ABI report for <u>"+meta["OldRepo"]+"</u> vs <u>"+meta["NewRepo"]+"</u></h1>\n")
+    
+    unchanged = len([p for p in meta["Packages"] if p["Status"]=="unchanged"])
+    f.write(HTML_TMPL["repo_info"] % {"old":meta["OldRepo"], "new":meta["NewRepo"], "unchanged":unchanged})
+    
+    f.write(HTML_TMPL["repo_packages"])
+    for p in meta["Packages"]:
+        if p["Status"]=="unchanged":
+            continue
+        
+        f.write("<tr>\n<td class='object'>"+p["Package"]+"</td>\n<td>"+p["Arch"]+"</td>\n")
+        f.write("<td>"+p.get("Version1", "-")+"</td>\n<td>"+p.get("Version2", "-")+"</td>\n")
+        
+        if p["Status"]=="compared":
+            bc = p.get("BC", p.get("Source_BC"))
+            f.write("<td class='"+get_bc_class(bc, 0)+"'><a href='"+p["Report"]+"'>"+str(bc)+"%</a></td>\n")
+        elif p["Status"]=="added":
+            f.write("<td class='added'>Added to repository</td>\n")
+        elif p["Status"]=="removed":
+            f.write("<td class='removed'>Removed from repository</td>\n")
+        elif p["Status"]=="skipped":
+            f.write("<td>Skipped: "+p["Reason"]+"</td>\n")
+        elif p["Status"]=="cancelled":
+            f.write("<td>Cancelled</td>\n")
+        else:
+            f.write("<td class='failed'>N/A: exit code "+str(p["Exit"])+"</td>\n")
+        f.write("</tr>\n")
+    
+    f.write(HTML_TMPL["footer"] % {"version":TOOL_VERSION})
+    f.close()
+
+def get_html_row(row, model, cols):
+    obj = row["name"]
+    
+    if row["status"]=="added":
+        return "<tr>\n<td class='object'>"+obj+"</td>\n<td colspan=\'"+str(cols)+"\' class='added'>Added to package</td>\n</tr>\n"
+    
+    name = obj
+    if "soname" in row:
+        name += "<br/><br/><span class='incompatible'>(changed SONAME from<br/>\""+row["soname"][0]+"\"<br/>to<br/>\""+row["soname"][1]+"\")</span>"
+    elif row.get("renamed"):
+        name += "<br/><br/><span class='incompatible'>(changed file name from<br/>\""+obj+"\"<br/>to<br/>\""+row["new_name"]+"\")</span>"
+    
+    if row.get("match") in ["short name", "shortest name", "symbols", "single object"]:
+        if "similarity" in row:
+            name += "<br/><br/><span class='match'>(matched by exported symbols, "+row["similarity"]+"% in common)</span>"
+        else:
+            name += "<br/><br/><span class='match'>(matched by "+row["match"]+")</span>"
+    
+    html = "<tr>\n<td class='object'>"+name+"</td>\n"
+    
+    if row["status"]=="removed":
+        html += "<td colspan=\'"+str(cols)+"\' class='removed'>Removed from package</td>\n"
+    elif row.get("reason"):
+        html += "<td colspan=\'"+str(cols)+"\' class='failed'>N/A: "+row["reason"]+"</td>\n"
+    elif row["status"]=="n/a":
+        html += "<td>N/A</td>\n"*cols
+    else:
+        for kind in ["bin", "src"]:
+            if model[kind]:
+                res = row[kind]
+                rate = 100 - float(res["affected"])
+                html += "<td class=\'"+get_bc_class(rate, res["total"])+"\'>"
+                html += "<a href='"+res["path"]+"'>"+format_num(rate)+"%</a>"
+                html += "</td>\n"
+        
+        if model["bin"]:
+            res = row["bin"]
+        else:
+            res = row["src"]
+        
+        if int(res["added"])>0:
+            html += "<td class='added'><a class='num' href='"+res["path"]+"#Added'>"+res["added"]+" new</a></td>\n"
+        else:
+            html += "<td class='ok'>0</td>\n"
+        
+        if int(res["removed"])>0:
+            html += "<td class='removed'><a class='num' href='"+res["path"]+"#Removed'>"+res["removed"]+" removed</a></td>\n"
+        else:
+            html += "<td class='ok'>0</td>\n"
+        
+        html += "<td>"+str(row["symbols"])+"</td>\n"
+    
+    html += "</tr>\n"
+    return html
+
+def get_number(num):
+    if num.find(".")!=-1:
+        return float(num)
+    return int(num)
+
+def write_meta(path, model):
+    meta = collections.OrderedDict()
+    if model["bin"]:
+        meta["BC"] = get_number(model["bc"])
+        meta["BC_Effective"] = get_number(model["bc_eff"])
+    if model["src"]:
+        meta["Source_BC"] = get_number(model["bc_src"])
+    meta["Added"] = model["added"]
+    meta["Removed"] = model["removed"]
+    if model["bin"]:
+        meta["TotalProblems"] = model["problems"]
+    if model["src"]:
+        meta["Source_TotalProblems"] = model["problems_src"]
+    meta["ObjectsAdded"] = model["objects_added"]
+    meta["ObjectsRemoved"] = model["objects_removed"]
+    meta["ChangedSoname"] = model["changed_soname"]
+    meta["ObjectsFailed"] = model["failed"]
+    
+    meta["Package"] = model["name1"]
+    meta["Version1"] = model["ver1"]
+    meta["Version2"] = model["ver2"]
+    meta["Arch"] = model["arch"]
+    if model["objects_only"] or model["objects_skip"]:
+        meta["Subset"] = collections.OrderedDict()
+        if model["objects_only"]:
+            meta["Subset"]["Objects"] = model["objects_only"].split(";")
+        if model["objects_skip"]:
+            meta["Subset"]["SkipObjects"] = model["objects_skip"].split(";")
+    
+    objects = []
+    for row in model["objects"]:
+        o = collections.OrderedDict()
+        o["Object"] = row["name"]
+        if "new_name" in row:
+            o["NewObject"] = row["new_name"]
+            o["Match"] = row["match"]
+        if "similarity" in row:
+            o["Similarity"] = get_number(row["similarity"])
+        o["Status"] = row["status"]
+        if "reason" in row:
+            o["Reason"] = row["reason"]
+        if "soname" in row:
+            o["OldSoname"] = row["soname"][0]
+            o["NewSoname"] = row["soname"][1]
+        if row["status"]=="compared":
+            for kind, prefix in [("bin", ""), ("src", "Source_")]:
+                if model[kind]:
+                    res = row[kind]
+                    o[prefix+"BC"] = get_number(format_num(100-float(res["affected"])))
+                    o[prefix+"Added"] = int(res["added"])
+                    o[prefix+"Removed"] = int(res["removed"])
+                    o[prefix+"TotalProblems"] = int(res["total"])
+                    o[prefix+"Report"] = res["path"]
+            o["TotalSymbols"] = row["symbols"]
+        objects.append(o)
+    meta["Objects"] = objects
+    
+    with open(path, "w") as f:
+        json.dump(meta, f, indent=2, separators=(",", ": "))
+        f.write("\n")
+
+def open_results_db(path):
+    db = sqlite3.connect(path, timeout=600)
+    db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, time REAL, package TEXT, arch TEXT, ver1 TEXT, ver2 TEXT, bc REAL, bc_eff REAL, bc_src REAL, problems INTEGER, problems_src INTEGER, added INTEGER, removed INTEGER, objects_added INTEGER, objects_removed INTEGER, changed_soname INTEGER, failed INTEGER, report TEXT, UNIQUE (package, arch, ver1, ver2))")
+    db.execute("CREATE TABLE IF NOT EXISTS objects (run INTEGER, object TEXT, new_object TEXT, status TEXT, match TEXT, symbols INTEGER)")
+    db.execute("CREATE TABLE IF NOT EXISTS object_stats (run INTEGER, object TEXT, report TEXT, field TEXT, value TEXT)")
+    for table, column in [("runs", "package"), ("runs", "arch"), ("runs", "ver1"), ("runs", "ver2"), ("objects", "run"), ("object_stats", "run")]:
+        db.execute("CREATE INDEX IF NOT EXISTS "+table+"_"+column+" ON "+table+" ("+column+")")
+    return db
+
+def add_results(path, model, report_dir):
+    # a rebuilt report replaces the results of the same versions
+    try:
+        db = open_results_db(path)
+        key = (model["name1"], model["arch"], model["ver1"], model["ver2"])
+        for (run_id,) in db.execute("SELECT id FROM runs WHERE package=? AND arch=? AND ver1=? AND ver2=?", key).fetchall():
+            for table in ["objects", "object_stats"]:
+                db.execute("DELETE FROM "+table+" WHERE run=?", (run_id,))
+            db.execute("DELETE FROM runs WHERE id=?", (run_id,))
+        
+        # NULL for rates and problems of kinds that were not compared
+        computed = {"bc":model["bin"], "bc_eff":model["bin"], "bc_src":model["src"], "problems":model["bin"], "problems_src":model["src"]}
+        
+        values = [time.time()]+list(key)
+        for k in ["bc", "bc_eff", "bc_src"]:
+            if k in model and computed[k]:
+                values.append(float(model[k]))
+            else:
+                values.append(None)
+        for k in ["problems", "problems_src", "added", "removed", "objects_added", "objects_removed", "changed_soname", "failed"]:
+            if computed.get(k, True):
+                values.append(model.get(k))
+            else:
+                values.append(None)
+        values.append(os.path.abspath(report_dir))
+        cur = db.execute("INSERT INTO runs (time, package, arch, ver1, ver2, bc, bc_eff, bc_src, problems, problems_src, added, removed, objects_added, objects_removed, changed_soname, failed, report) VALUES ("+", ".join(["?"]*len(values))+")", values)
+        
+        for row in model["objects"]:
+            db.execute("INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?)", (cur.lastrowid, row["name"], row.get("new_name"), row["status"], row.get("match"), row.get("symbols")))
+            for kind in ["bin", "src"]:
+                if kind in row:
+                    db.executemany("INSERT INTO object_stats VALUES (?, ?, ?, ?, ?)", [(cur.lastrowid, row["name"], kind, k, str(v)) for k, v in sorted(row[kind].items())])
+        
+        db.commit()
+        db.close()
+    except sqlite3.Error as e:
+        print_err("WARNING: failed to add results to "+path+" ("+str(e)+")")
+
+def query_results(name):
+    if not ARGS.results_db:
+        exit_status("Error", "results database is not specified (-results-db option)")
+    
+    if not os.path.exists(ARGS.results_db):
+        exit_status("Error", "can't access \'"+ARGS.results_db+"\'")
+    
+    query = "SELECT package, arch, ver1, ver2, bc, bc_eff, bc_src, problems, problems_src, objects_removed, failed, time FROM runs WHERE package GLOB ?"
+    params = [name]
+    if ARGS.bc_below is not None:
+        query += " AND bc<?"
+        params.append(ARGS.bc_below)
+    query += " ORDER BY package, arch, time"
+    
+    db = open_results_db(ARGS.results_db)
+    found = db.execute(query, params).fetchall()
+    db.close()
+    
+    for package, arch, ver1, ver2, bc, bc_eff, bc_src, problems, problems_src, objects_removed, failed, rtime in found:
+        res = [package, arch, ver1+" -> "+ver2]
+        if bc is not None:
+            res.append("BC: "+format_num(bc)+"%")
+            res.append("BC eff.: "+format_num(bc_eff)+"%")
+        if bc_src is not None:
+            res.append("SC: "+format_num(bc_src)+"%")
+        if problems is not None:
+            res.append("problems: "+str(problems))
+        elif problems_src is not None:
+            # -src only
+            res.append("source problems: "+str(problems_src))
+        if objects_removed:
+            res.append("removed objects: "+str(objects_removed))
+        if failed:
+            res.append("failed: "+str(failed))
+        res.append(time.strftime("%Y-%m-%d %H:%M", time.localtime(rtime)))
+        print ", ".join(res)
+    
+    if not found:
+        exit_status("Error", "no results found for \'"+name+"\'")
+    
+    s_exit("Ok")
+
+def get_bc_class(rate, total):
+    cclass = "ok"
+    if float(rate)==100:
+        if total:
+            cclass = "warning"
+    else:
         if float(rate)>=90:
             cclass = "warning"
         elif float(rate)>=80:
@@ -361,77 +1988,2168 @@ def get_bc_class(rate, total):
         else:
             cclass = "incompatible"
     
-    return cclass
-
-def format_num(num):
-    num = re.sub(r"\A(\d+\.\d\d).*\Z", r"\1", str(num))
-    num = re.sub(r"(\.\d)0\Z", r"\1", num)
-    num = re.sub(r"\A(\d+)\.0\Z", r"\1", num)
-    return num
+    return cclass
+
+def format_num(num):
+    num = re.sub(r"\A(\d+\.\d\d).*\Z", r"\1", str(num))
+    num = re.sub(r"(\.\d)0\Z", r"\1", num)
+    num = re.sub(r"\A(\d+)\.0\Z", r"\1", num)
+    return num
+
+def get_dumpversion(prog):
+    key = ("dumpversion", prog)
+    if key not in PROBES:
+        PROBES[key] = subprocess.check_output([prog, "-dumpversion"]).rstrip()
+    return PROBES[key]
+
+def get_version(prog):
+    key = ("version", prog)
+    if key not in PROBES:
+        PROBES[key] = subprocess.check_output([prog, "--version"]).rstrip()
+    return PROBES[key]
+
+def cmp_vers(x, y):
+    xp = x.split(".")
+    yp = y.split(".")
+    
+    for k in range(len(xp), max(len(xp), len(yp))):
+        xp.append("0")
+    
+    for k in range(len(yp), max(len(xp), len(yp))):
+        yp.append("0")
+    
+    for k in range(0, len(xp)):
+        a = xp[k]
+        b = yp[k]
+        
+        if a==b:
+            continue
+        
+        if(int(a) > int(b)):
+            return 1
+        else:
+            return -1
+    
+    return 0
+
+def get_dump_attr(path):
+    attr = {}
+    attr["empty"] = False
+    attr["lang"] = None
+    
+    path = get_dump_file(path)
+    if path.endswith(".bin"):
+        dump = open_compact_dump(path)
+        meta = read_compact_meta(dump)
+        close_compact_dump(dump)
+        attr["lang"] = meta.get("Language")
+        attr["empty"] = (meta["SymbolInfo"]==0)
+        return attr
+    
+    f = open(path, 'r')
+    for line in f:
+        if line.find("'Language' =>")!=-1:
+            m = re.search(r"'Language' => '(.+)'", line)
+            if m:
+                attr["lang"] = m.group(1)
+        elif line.find("'SymbolInfo' =>")!=-1:
+            attr["empty"] = (line.find("'SymbolInfo' => {}")!=-1)
+            break
+    
+    f.close()
+    return attr
+
+def count_symbols(path, obj, age):
+    global ABI_CC
+    task = new_task("count", [ABI_CC, "-count-symbols", os.path.abspath(get_text_dump(path))])
+    task["msg"] = "Counting symbols in the ABI dump for "+os.path.basename(obj)+" ("+age+")"
+    task["dumps"] = [(2, path)]
+    task["object"] = obj
+    task["stdout"] = os.path.abspath(TMP_DIR_INT+"/count/"+task["id"])
+    return task
+
+def read_count(task):
+    if is_failed(task) or not os.path.exists(task["stdout"]):
+        print_err("ERROR: failed to count symbols in "+task["cmd"][-1])
+        return None
+    
+    return int(read_file(task["stdout"]).rstrip())
+
+def read_bytes(path):
+    fp = open(path, 'rb')
+    buf = fp.read()
+    fp.close()
+    return binascii.b2a_hex(buf[0:4])
+
+def get_history_path(arch, name):
+    dumps_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dumps_dir = ARGS.dumps_dir
+    
+    return dumps_dir+"/"+arch+"/"+name+"/history.json"
+
+def read_history(arch, name):
+    path = get_history_path(arch, name)
+    if os.path.exists(path):
+        try:
+            return json.loads(read_file(path))
+        except ValueError:
+            pass
+    
+    return {}
+
+def write_history(arch, name, history):
+    path = get_history_path(arch, name)
+    
+    d = os.path.dirname(path)
+    if not os.path.exists(d):
+        os.makedirs(d)
+    
+    tmp = path+"."+socket.gethostname()+"."+str(os.getpid())
+    write_file(tmp, json.dumps(history, indent=2, sort_keys=True, separators=(",", ": "))+"\n")
+    os.rename(tmp, path)
+
+def get_history_key(oname):
+    # stable between SONAME bumps
+    shname = get_short_name(oname)
+    if shname:
+        return shname
+    return oname
+
+def index_debuginfo(files):
+    index = {}
+    for path in files:
+        m = re.search(r"/\.build-id/(\w\w)/(\w+)\.debug\Z", path)
+        if m:
+            index[m.group(1)+m.group(2)] = path
+        index[os.path.basename(path)] = path
+    
+    return index
+
+def index_debug_store(store):
+    # build-id -> debuginfo file, read once per run
+    key = ("debug_store", os.path.abspath(store))
+    if key in PROBES:
+        return PROBES[key]
+    
+    top = store
+    if os.path.isdir(store+"/.build-id"):
+        top = store+"/.build-id"
+    
+    # the store files are often symlinks
+    index = {}
+    for root, dirs, files in os.walk(top):
+        for f in files:
+            m = re.search(r"(\A|/)(\w\w)/(\w+)\.debug\Z", root+"/"+f)
+            if m:
+                index[m.group(2)+m.group(3)] = root+"/"+f
+    
+    PROBES[key] = index
+    return index
+
+def link_debug_store(age, objects):
+    # debuginfo files found in the store are linked into the layout
+    # searched by abi-dumper
+    index = index_debug_store(ARGS.debug_store)
+    top = TMP_DIR_INT+"/debug-store/"+age
+    
+    found = {}
+    for obj in objects:
+        bid = get_build_id(obj)
+        if not bid or bid not in index:
+            continue
+        
+        link = top+"/usr/lib/debug/.build-id/"+bid[:2]+"/"+bid[2:]+".debug"
+        if not os.path.lexists(link):
+            if not os.path.exists(os.path.dirname(link)):
+                os.makedirs(os.path.dirname(link))
+            os.symlink(os.path.realpath(index[bid]), link)
+        found[os.path.basename(obj)] = link
+    
+    # supplementary files of dwz
+    dwz = top+"/usr/lib/debug/.dwz"
+    if found and os.path.isdir(ARGS.debug_store+"/.dwz") and not os.path.lexists(dwz):
+        os.symlink(os.path.realpath(ARGS.debug_store+"/.dwz"), dwz)
+    
+    return found
+
+def find_debuginfo(obj, index):
+    bid = get_build_id(obj)
+    if bid and bid in index:
+        return index[bid]
+    
+    oname = os.path.basename(obj)
+    for name in [oname+".debug", get_short_name(oname)]:
+        if name in index:
+            return index[name]
+    
+    return None
+
+def estimate_mem(obj, debug_index, hist):
+    # in KB
+    dwarf = get_dwarf_size(obj)
+    
+    debug_file = find_debuginfo(obj, debug_index)
+    if debug_file:
+        dwarf += get_dwarf_size(debug_file)
+    
+    if not dwarf:
+        dwarf = os.path.getsize(obj)
+    
+    if hist and hist.get("rss") and hist.get("dwarf"):
+        # learned from previous dumps of this object, with 10% margin
+        return int(1.1*hist["rss"]*dwarf/hist["dwarf"]), dwarf
+    
+    return int(MEM_BASE+MEM_PER_DWARF*dwarf/1024), dwarf
+
+def estimate_dump_time(obj, dwarf, hist):
+    if hist and hist.get("time") and hist.get("dwarf"):
+        return hist["time"]*dwarf/hist["dwarf"]
+    
+    return (os.path.getsize(obj)+dwarf)*DUMP_SEC_PER_BYTE
+
+def estimate_compare_time(size, hist):
+    if hist and hist.get("compare_time") and hist.get("dumps_size"):
+        return hist["compare_time"]*size/hist["dumps_size"]
+    
+    return size*COMPARE_SEC_PER_BYTE
+
+def load_dump_index(root):
+    global DUMP_INDEX
+    root = os.path.abspath(root)
+    
+    dumps = DUMP_INDEX["dumps"]
+    if root in DUMP_INDEX["roots"]:
+        dumps.difference_update([d for d in dumps if d.startswith(root+"/")])
+    
+    DUMP_INDEX["roots"][root] = 1
+    if os.path.isdir(root):
+        for f, fpath in list_files(root):
+            if f in ["ABI.dump", "ABI.bin"]:
+                dumps.add(os.path.dirname(fpath)+"/ABI.dump")
+
+def get_compact_path(path):
+    return os.path.dirname(path)+"/ABI.bin"
+
+def get_dump_file(path):
+    # ABI dumps are referred to by the path of the text dump, the
+    # compact one is used if there is no text dump
+    if not os.path.exists(path) and os.path.exists(get_compact_path(path)):
+        return get_compact_path(path)
+    
+    return path
+
+def has_dump(path):
+    # Directories indexed by the daemon answer misses without a disk
+    # lookup, dumps created by its jobs are added to the index. Hits
+    # are checked, dumps may be removed by other runs.
+    path = os.path.abspath(path)
+    if path not in DUMP_INDEX["dumps"]:
+        if any([path.startswith(root+"/") for root in DUMP_INDEX["roots"]]):
+            return False
+    
+    found = os.path.exists(path) or os.path.exists(get_compact_path(path))
+    if not found:
+        DUMP_INDEX["dumps"].discard(path)
+    
+    return found
+
+def add_dump(path):
+    path = os.path.abspath(path)
+    DUMP_INDEX["dumps"].add(path)
+    
+    # daemon jobs report new dumps to the daemon
+    if DUMP_INDEX["log"]:
+        with open(DUMP_INDEX["log"], "a") as f:
+            f.write(path+"\n")
+
+def clean_dump_tmp(obj_dir):
+    # temp directories of dumps left by killed runs
+    if not os.path.isdir(obj_dir):
+        return
+    
+    for name in os.listdir(obj_dir):
+        m = re.match(r"\.tmp-(.+)-(\d+)\Z", name)
+        if not m:
+            continue
+        
+        path = obj_dir+"/"+name
+        if m.group(1)==socket.gethostname():
+            try:
+                os.kill(int(m.group(2)), 0)
+                continue
+            except OSError as e:
+                if e.errno!=errno.ESRCH:
+                    continue
+        elif time.time()-os.path.getmtime(path)<CACHE_GRACE:
+            continue
+        
+        shutil.rmtree(path, True)
+
+def remove_dump(path):
+    DUMP_INDEX["dumps"].discard(os.path.abspath(path))
+    for p in [path, get_compact_path(path)]:
+        if os.path.exists(p):
+            os.remove(p)
+
+def read_dump_records(f):
+    # entries of SymbolInfo and TypeInfo sections and the text between
+    # them from the Data::Dumper output of abi-dumper, line by line
+    section = None
+    entry = None
+    text = []
+    
+    for line in f:
+        if entry is not None:
+            entry["text"].append(line)
+            m = re.match(r"      '(MnglName|ShortName|Name|Type)' => '((?:[^'\\]|\\.)*)'", line)
+            if m:
+                entry[m.group(1)] = re.sub(r"\\(.)", r"\1", m.group(2))
+            elif re.match(r"    \},?\n?\Z", line):
+                yield entry
+                entry = None
+            continue
+        
+        m = re.match(r"  '(\w+)' => ", line)
+        if m:
+            section = m.group(1)
+        elif section in ["SymbolInfo", "TypeInfo"] and re.match(r"    '\d+' => \{", line):
+            if text:
+                yield {"section":None, "text":text}
+                text = []
+            entry = {"section":section, "text":[line]}
+            continue
+        
+        text.append(line)
+    
+    if entry is not None:
+        yield entry
+    
+    if text:
+        yield {"section":None, "text":text}
+
+def get_entry_names(entry):
+    # symbol name and short name, type name, short name and kind
+    if entry["section"]=="SymbolInfo":
+        name = entry.get("MnglName") or entry.get("ShortName")
+        if name:
+            return (name, entry.get("ShortName", name))
+    elif entry["section"]=="TypeInfo":
+        if entry.get("Name") and entry.get("Type") in ["Struct", "Class", "Union", "Enum", "Typedef"]:
+            return (entry["Name"], re.sub(r"\A(struct|class|union|enum) ", "", entry["Name"]), entry["Type"])
+    
+    return None
+
+def read_dump_names(path):
+    # symbols and types of an ABI dump
+    symbols = set()
+    types = set()
+    
+    path = get_dump_file(path)
+    if path.endswith(".bin"):
+        dump = open_compact_dump(path)
+        for section, offset, pos, size, names in read_compact_index(dump):
+            if section=="SymbolInfo":
+                symbols.add(names)
+            else:
+                types.add(names)
+        close_compact_dump(dump)
+        return symbols, types
+    
+    f = open(path, 'r')
+    for entry in read_dump_records(f):
+        names = get_entry_names(entry)
+        if not names:
+            continue
+        if entry["section"]=="SymbolInfo":
+            symbols.add(names)
+        else:
+            types.add(names)
+    f.close()
+    
+    return symbols, types
+
+def write_compact_dump(path):
+    # length-prefixed zlib blocks of entries in the order of the text
+    # dump, then metadata (top-level scalars and number of entries) and
+    # the index of symbols and types: section, offset of the block,
+    # position of the entry in the block and names
+    dst = get_compact_path(path)
+    tmp = dst+".tmp-"+str(os.getpid())
+    meta = {"SymbolInfo":0, "TypeInfo":0}
+    index = []
+    block = {"text":[], "size":0, "index":[]}
+    
+    def flush():
+        data = zlib.compress("".join(block["text"]))
+        for item in block["index"]:
+            item[1] = out.tell()
+        out.write(struct.pack(">I", len(data)))
+        out.write(data)
+        block.update({"text":[], "size":0, "index":[]})
+    
+    f = open(path, 'r')
+    out = open(tmp, 'wb')
+    out.write(struct.pack(COMPACT_HEAD, COMPACT_MAGIC, 0, 0))
+    for entry in read_dump_records(f):
+        text = "".join(entry["text"])
+        
+        if entry["section"] is None:
+            for line in entry["text"]:
+                m = re.match(r"  '(\w+)' => '((?:[^'\\]|\\.)*)',?\n?\Z", line)
+                if m:
+                    meta[m.group(1)] = re.sub(r"\\(.)", r"\1", m.group(2))
+        else:
+            meta[entry["section"]] += 1
+            names = get_entry_names(entry)
+            if names:
+                item = [entry["section"], None, block["size"], len(text), names]
+                block["index"].append(item)
+                index.append(item)
+        
+        block["text"].append(text)
+        block["size"] += len(text)
+        if block["size"]>=COMPACT_BLOCK:
+            flush()
+    f.close()
+    
+    if block["text"]:
+        flush()
+    
+    meta_offset = out.tell()
+    data = json.dumps(meta)
+    out.write(struct.pack(">I", len(data)))
+    out.write(data)
+    
+    index_offset = out.tell()
+    out.write(struct.pack(">I", len(index)))
+    for section, offset, pos, size, names in index:
+        out.write(struct.pack(COMPACT_ITEM, ["SymbolInfo", "TypeInfo"].index(section), offset, pos, size, len(names)))
+        for name in names:
+            out.write(struct.pack(">I", len(name)))
+            out.write(name)
+    
+    out.seek(0)
+    out.write(struct.pack(COMPACT_HEAD, COMPACT_MAGIC, index_offset, meta_offset))
+    out.close()
+    
+    os.rename(tmp, dst)
+
+def open_compact_dump(path):
+    f = open(path, 'rb')
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    f.close()
+    
+    magic, index_offset, meta_offset = struct.unpack(COMPACT_HEAD, buf[:struct.calcsize(COMPACT_HEAD)])
+    if magic!=COMPACT_MAGIC:
+        buf.close()
+        exit_status("Error", "invalid compact ABI dump \'"+path+"\'")
+    
+    return {"path":path, "buf":buf, "index":index_offset, "meta":meta_offset}
+
+def close_compact_dump(dump):
+    dump["buf"].close()
+
+def read_compact_block(dump, offset):
+    buf = dump["buf"]
+    size = struct.unpack(">I", buf[offset:offset+4])[0]
+    return zlib.decompress(buf[offset+4:offset+4+size])
+
+def read_compact_meta(dump):
+    buf = dump["buf"]
+    offset = dump["meta"]
+    size = struct.unpack(">I", buf[offset:offset+4])[0]
+    return json.loads(buf[offset+4:offset+4+size])
+
+def read_compact_index(dump):
+    # (section, offset of the block, position and size in the block,
+    # names) of symbols and types
+    buf = dump["buf"]
+    pos = dump["index"]
+    n = struct.unpack(">I", buf[pos:pos+4])[0]
+    pos += 4
+    
+    item_size = struct.calcsize(COMPACT_ITEM)
+    index = []
+    for i in range(0, n):
+        section, offset, epos, esize, k = struct.unpack(COMPACT_ITEM, buf[pos:pos+item_size])
+        pos += item_size
+        names = []
+        for j in range(0, k):
+            size = struct.unpack(">I", buf[pos:pos+4])[0]
+            names.append(buf[pos+4:pos+4+size])
+            pos += 4+size
+        index.append((["SymbolInfo", "TypeInfo"][section], offset, epos, esize, tuple(names)))
+    
+    return index
+
+def export_compact_dump(dump, path):
+    buf = dump["buf"]
+    tmp = path+".tmp-"+str(os.getpid())
+    out = open(tmp, 'wb')
+    
+    offset = struct.calcsize(COMPACT_HEAD)
+    while offset<dump["meta"]:
+        out.write(read_compact_block(dump, offset))
+        offset += 4+struct.unpack(">I", buf[offset:offset+4])[0]
+    
+    out.close()
+    os.rename(tmp, path)
+
+def get_text_dump(path):
+    # compact dumps are exported to the workspace once per run
+    path = get_dump_file(path)
+    if not path.endswith(".bin"):
+        return path
+    
+    text = TMP_DIR_INT+"/export/"+hashlib.md5(os.path.abspath(path)).hexdigest()+"/ABI.dump"
+    if not os.path.exists(text):
+        if not os.path.exists(os.path.dirname(text)):
+            os.makedirs(os.path.dirname(text))
+        dump = open_compact_dump(path)
+        export_compact_dump(dump, text)
+        close_compact_dump(dump)
+    
+    return text
+
+def open_symbol_index(dumps_dir):
+    db = sqlite3.connect(dumps_dir+"/symbols.db", timeout=600)
+    db.execute("CREATE TABLE IF NOT EXISTS dumps (id INTEGER PRIMARY KEY, path TEXT UNIQUE, arch TEXT, package TEXT, ver TEXT, object TEXT, mtime REAL, size INTEGER)")
+    db.execute("CREATE TABLE IF NOT EXISTS symbols (dump INTEGER, name TEXT, short TEXT)")
+    db.execute("CREATE TABLE IF NOT EXISTS types (dump INTEGER, name TEXT, short TEXT, kind TEXT)")
+    for table, column in [("symbols", "name"), ("symbols", "short"), ("symbols", "dump"), ("types", "short"), ("types", "dump")]:
+        db.execute("CREATE INDEX IF NOT EXISTS "+table+"_"+column+" ON "+table+" ("+column+")")
+    return db
+
+def update_symbol_index(dumps_dir, paths=None):
+    # only new and changed dumps are read, all dumps of the directory
+    # are checked and removed ones are dropped if paths are not given
+    if not os.path.isdir(dumps_dir):
+        return
+    
+    root = os.path.abspath(dumps_dir)
+    if paths is None:
+        paths = set([os.path.dirname(fpath)+"/ABI.dump" for f, fpath in list_files(root) if f in ["ABI.dump", "ABI.bin"]])
+        full = True
+    else:
+        full = False
+    paths = [get_dump_file(path) for path in paths]
+    
+    try:
+        db = open_symbol_index(dumps_dir)
+        indexed = {}
+        for dump_id, rpath, mtime, size in db.execute("SELECT id, path, mtime, size FROM dumps"):
+            indexed[rpath] = (dump_id, mtime, size)
+        
+        seen = set()
+        for path in paths:
+            rpath = os.path.relpath(os.path.abspath(path), root)
+            parts = rpath.split("/")
+            if len(parts)<5:
+                continue
+            seen.add(rpath)
+            
+            st = os.stat(path)
+            if rpath in indexed and indexed[rpath][1:]==(st.st_mtime, st.st_size):
+                continue
+            
+            symbols, types = read_dump_names(path)
+            if rpath in indexed:
+                drop_index_entry(db, indexed[rpath][0])
+            
+            cur = db.execute("INSERT INTO dumps (path, arch, package, ver, object, mtime, size) VALUES (?, ?, ?, ?, ?, ?, ?)", (rpath, parts[0], parts[1], parts[2], "/".join(parts[3:-1]), st.st_mtime, st.st_size))
+            db.executemany("INSERT INTO symbols VALUES (?, ?, ?)", [(cur.lastrowid,)+s for s in symbols])
+            db.executemany("INSERT INTO types VALUES (?, ?, ?, ?)", [(cur.lastrowid,)+t for t in types])
+        
+        if full:
+            for rpath in indexed:
+                if rpath not in seen:
+                    drop_index_entry(db, indexed[rpath][0])
+        
+        db.commit()
+        db.close()
+    except sqlite3.Error as e:
+        print_err("WARNING: failed to update the symbol index in "+dumps_dir+" ("+str(e)+")")
+
+def drop_index_entry(db, dump_id):
+    for table in ["symbols", "types"]:
+        db.execute("DELETE FROM "+table+" WHERE dump=?", (dump_id,))
+    db.execute("DELETE FROM dumps WHERE id=?", (dump_id,))
+
+def query_symbol(name):
+    dumps_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dumps_dir = ARGS.dumps_dir
+    
+    if not os.path.isdir(dumps_dir):
+        exit_status("Error", "can't access \'"+dumps_dir+"\'")
+    
+    update_symbol_index(dumps_dir)
+    
+    db = open_symbol_index(dumps_dir)
+    found = db.execute("SELECT d.arch, d.package, d.ver, d.object, 'symbol', s.name FROM symbols s JOIN dumps d ON d.id=s.dump WHERE s.name GLOB ?1 OR s.short GLOB ?1 UNION SELECT d.arch, d.package, d.ver, d.object, 'type', t.name FROM types t JOIN dumps d ON d.id=t.dump WHERE t.name GLOB ?1 OR t.short GLOB ?1 ORDER BY 1, 2, 3, 4, 5, 6", (name,)).fetchall()
+    db.close()
+    
+    for arch, package, ver, obj, kind, sname in found:
+        print arch+"/"+package+"/"+ver+"/"+obj+": "+kind+" "+sname
+    
+    if not found:
+        exit_status("Error", "\'"+name+"\' is not found in ABI dumps of "+dumps_dir)
+    
+    s_exit("Ok")
+
+def chmod_777(path):
+    # directories only, files may be hard links to the extraction cache
+    subprocess.call(["find", path, "-type", "d", "-exec", "chmod", "777", "{}", "+"])
+
+def new_task(kind, cmd, cwd=None):
+    global TASKS_N
+    TASKS_N += 1
+    
+    task = {}
+    task["id"] = socket.gethostname()+"-"+str(os.getpid())+"-"+str(TASKS_N)
+    task["kind"] = kind
+    task["cmd"] = cmd
+    task["cwd"] = cwd
+    task["ok"] = [0]
+    task["tries"] = 0
+    
+    timeout = {"extract":ARGS.extract_timeout, "dump":ARGS.dump_timeout, "compare":ARGS.compare_timeout, "count":ARGS.compare_timeout}
+    task["timeout"] = timeout.get(kind)
+    
+    return task
+
+def spawn_task(task):
+    if ARGS.debug:
+        if isinstance(task["cmd"], list):
+            print "Executing "+" ".join(task["cmd"])
+        else:
+            print "Executing "+str(task["cmd"])
+    
+    out = {}
+    for k in ["stdout", "stderr"]:
+        out[k] = None
+        if task.get(k):
+            d = os.path.dirname(task[k])
+            if not os.path.exists(d):
+                os.makedirs(d)
+            out[k] = open(task[k], "a")
+    
+    # own process group to kill the whole tree on timeout
+    proc = subprocess.Popen(task["cmd"], shell=task.get("shell", False), cwd=task["cwd"], stdout=out["stdout"], stderr=out["stderr"], preexec_fn=os.setsid)
+    RUNNING[proc.pid] = proc
+    
+    for k in out:
+        if out[k]:
+            out[k].close()
+    
+    task["start"] = time.time()
+    task["killed"] = False
+    return proc
+
+def kill_task(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def kill_tasks():
+    for pid in RUNNING.keys():
+        kill_task(RUNNING.pop(pid))
+    
+    # tasks not claimed by workers yet
+    for tid in QUEUED.keys():
+        try:
+            os.remove(QUEUED.pop(tid))
+        except OSError:
+            pass
+
+def check_timeout(task, proc):
+    if task["timeout"] and not task["killed"]:
+        if time.time()-task["start"]>task["timeout"]:
+            print_err("WARNING: task timed out after "+str(task["timeout"])+" seconds: "+task.get("msg", task["id"]))
+            task["killed"] = True
+            kill_task(proc)
+
+def get_task_error(task):
+    if task.get("killed"):
+        return "timed out after "+str(task["timeout"])+" seconds"
+    
+    # the first message of the task, usually the cause
+    err = "exit code "+str(task["ecode"])
+    if task.get("stderr") and os.path.exists(task["stderr"]):
+        lines = [line.strip() for line in read_file(task["stderr"]).splitlines() if line.strip()]
+        if lines:
+            err += ": "+lines[0]
+    
+    return err
+
+def is_failed(task):
+    return task["killed"] or task["ecode"] not in task["ok"]
+
+def retry_task(task):
+    if is_failed(task) and update_dump_args(task):
+        # not counted as a try
+        print "Retrying with the compact ABI dump: "+task.get("msg", task["id"])
+        return True
+    
+    if is_failed(task) and task["tries"]<ARGS.retries:
+        task["tries"] += 1
+        print "Retrying ("+str(task["tries"])+"/"+str(ARGS.retries)+"): "+task.get("msg", task["id"])
+        return True
+    
+    return False
+
+def update_dump_args(task):
+    # text ABI dumps of a task removed after conversion by another run
+    # are exported from the compact ones
+    changed = False
+    for i, path in task.get("dumps", []):
+        if not os.path.exists(task["cmd"][i]):
+            text = os.path.abspath(get_text_dump(path))
+            if text!=task["cmd"][i] and os.path.exists(text):
+                task["cmd"][i] = text
+                changed = True
+    
+    return changed
+
+def wait_task(task, proc):
+    # non-blocking, records exit code, time and peak RSS (KB)
+    pid, status, ru = os.wait4(proc.pid, os.WNOHANG)
+    if not pid:
+        return False
+    
+    RUNNING.pop(proc.pid, None)
+    
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    
+    task["ecode"] = proc.returncode
+    task["time"] = time.time()-task["start"]
+    task["rss"] = ru.ru_maxrss
+    return True
+
+def pick_task(pending, running):
+    if not ARGS.max_mem:
+        return pending.pop(0)
+    
+    budget = ARGS.max_mem*1024
+    used = sum([task.get("mem", 0) for task, proc in running])
+    
+    for task in pending:
+        if used+task.get("mem", 0)<=budget:
+            pending.remove(task)
+            return task
+    
+    if not running:
+        # run anyway, one at a time
+        task = pending.pop(0)
+        print "WARNING: estimated memory usage of the task ("+str(task["mem"]/1024)+"MB) exceeds the limit"
+        return task
+    
+    return None
+
+def sort_tasks(tasks):
+    # higher priority and longest first, the stable sort keeps the given
+    # order of equal tasks
+    return sorted(tasks, key=lambda task: (-task.get("priority", 0), -task.get("cost", 0)))
+
+def get_task_info(task):
+    info = {"id":task["id"], "kind":task["kind"]}
+    for k in ["object", "age", "package"]:
+        if k in task:
+            info[k] = task[k]
+    return info
+
+def get_eta(progress):
+    # estimated costs are scaled by the actual time of finished tasks
+    elapsed = time.time()-progress["start"]
+    left = progress["cost"]-progress["done_cost"]
+    
+    if progress["done_cost"]>0:
+        eta = elapsed*left/progress["done_cost"]
+    elif progress["done"]:
+        eta = elapsed*(progress["total"]-progress["done"])/progress["done"]
+    else:
+        eta = left/max(ARGS.jobs, 1)
+    
+    return round(eta, 1)
+
+def task_finished(task, progress):
+    progress["done"] += 1
+    progress["done_cost"] += task.get("cost", 0)
+    if is_failed(task):
+        progress["failed"] += 1
+    
+    info = get_task_info(task)
+    info.update({"duration":round(task["time"], 3), "exit":task["ecode"], "ok":not is_failed(task), "done":progress["done"], "total":progress["total"], "eta":get_eta(progress)})
+    if task.get("rss"):
+        info["rss"] = task["rss"]
+    if task.get("dwarf") and not is_failed(task):
+        info["dwarf"] = task["dwarf"]
+    if task["kind"]=="extract" and not is_failed(task):
+        info["bytes"] = get_extracted_size(task)
+    emit_event("task_finish", **info)
+    
+    # the callback may return new tasks of the stage
+    more = []
+    if task.get("done"):
+        more = task["done"](task) or []
+    
+    progress["total"] += len(more)
+    progress["cost"] += sum([t.get("cost", 0) for t in more])
+    return more
+
+def run_tasks(tasks):
+    if not tasks:
+        return tasks
+    
+    kinds = sorted(set([task["kind"] for task in tasks]))
+    progress = {"stage":"+".join(kinds), "total":len(tasks), "done":0, "failed":0, "start":time.time(), "done_cost":0.0}
+    progress["cost"] = sum([task.get("cost", 0) for task in tasks])
+    emit_event("stage_start", stage=progress["stage"], tasks=len(tasks), eta=get_eta(progress))
+    
+    if ARGS.queue_dir:
+        run_queue_tasks(tasks, progress)
+    else:
+        run_local_tasks(tasks, progress)
+    
+    emit_event("stage_finish", stage=progress["stage"], tasks=len(tasks), failed=progress["failed"], duration=round(time.time()-progress["start"], 3))
+    return tasks
+
+def run_local_tasks(tasks, progress):
+    pending = sort_tasks(tasks)
+    running = []
+    
+    while pending or running:
+        while pending and len(running)<max(ARGS.jobs, 1):
+            task = pick_task(pending, running)
+            if task is None:
+                break
+            if task.get("msg"):
+                print task["msg"]
+            emit_event("task_start", **get_task_info(task))
+            running.append((task, spawn_task(task)))
+        
+        for task, proc in list(running):
+            if wait_task(task, proc):
+                running.remove((task, proc))
+                if retry_task(task):
+                    emit_event("task_retry", **get_task_info(task))
+                    pending.insert(0, task)
+                else:
+                    more = task_finished(task, progress)
+                    tasks.extend(more)
+                    pending[0:0] = sort_tasks(more)
+            else:
+                check_timeout(task, proc)
+        
+        if running:
+            time.sleep(0.05)
+
+def get_queue_dir(sub):
+    path = ARGS.queue_dir+"/"+sub
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # created by another process
+            pass
+    return path
+
+def write_json(path, data):
+    tmp = get_queue_dir("tmp")+"/"+os.path.basename(path)+"."+socket.gethostname()+"."+str(os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.rename(tmp, path)
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def run_queue_tasks(tasks, progress):
+    # a task file goes new/ -> run/ (claimed by a worker) -> done/
+    new_dir = get_queue_dir("new")
+    run_dir = get_queue_dir("run")
+    done_dir = get_queue_dir("done")
+    
+    def submit(task):
+        data = {}
+        for k in task:
+            if k!="done":
+                data[k] = task[k]
+        write_json(new_dir+"/"+task["qname"]+".json", data)
+        waiting[task["id"]] = task
+        QUEUED[task["id"]] = new_dir+"/"+task["qname"]+".json"
+    
+    def enqueue(task, rank):
+        if task.get("msg"):
+            print task["msg"]
+        # workers claim tasks in the order of names
+        task["qname"] = "%06d-%s" % (rank, task["id"])
+        qnames[task["qname"]] = task["id"]
+        emit_event("task_queued", **get_task_info(task))
+        submit(task)
+    
+    waiting = {}
+    qnames = {}
+    for rank, task in enumerate(sort_tasks(tasks)):
+        enqueue(task, rank)
+    
+    while waiting:
+        for tid in waiting.keys():
+            res_path = done_dir+"/"+tid+".json"
+            if os.path.exists(res_path):
+                res = read_json(res_path)
+                os.remove(res_path)
+                task = waiting.pop(tid)
+                QUEUED.pop(tid, None)
+                task["ecode"] = res["ecode"]
+                task["time"] = res["time"]
+                task["rss"] = res["rss"]
+                task["host"] = res["host"]
+                task["killed"] = res["killed"]
+                if retry_task(task):
+                    emit_event("task_retry", **get_task_info(task))
+                    submit(task)
+                else:
+                    # new tasks are claimed before the queued ones
+                    more = task_finished(task, progress)
+                    tasks.extend(more)
+                    for t in sort_tasks(more):
+                        enqueue(t, 0)
+        
+        # return tasks of dead workers back to the queue, heartbeats are
+        # compared with the time of the shared filesystem
+        claims = [name for name in os.listdir(run_dir) if qnames.get(name.split(".json@")[0]) in waiting]
+        if claims:
+            now = get_queue_time()
+        for name in claims:
+            path = run_dir+"/"+name
+            qname, worker = name.split(".json@")
+            try:
+                beat = get_queue_dir("beat")+"/"+worker
+                if not os.path.exists(beat):
+                    beat = path
+                if now-os.path.getmtime(beat)>QUEUE_STALE:
+                    os.rename(path, new_dir+"/"+qname+".json")
+            except OSError:
+                pass
+        
+        if waiting:
+            time.sleep(0.2)
+    
+    clock = get_queue_dir("tmp")+"/clock."+socket.gethostname()+"."+str(os.getpid())
+    if os.path.exists(clock):
+        os.remove(clock)
+
+def get_queue_time():
+    # hosts' clocks may differ, mtime of a touched file is set by the
+    # file server
+    path = get_queue_dir("tmp")+"/clock."+socket.gethostname()+"."+str(os.getpid())
+    open(path, "a").close()
+    os.utime(path, None)
+    return os.path.getmtime(path)
+
+def touch_beat(path):
+    open(path, "a").close()
+    os.utime(path, None)
+
+def claim_task():
+    new_dir = get_queue_dir("new")
+    run_dir = get_queue_dir("run")
+    
+    for name in sorted(os.listdir(new_dir)):
+        if not name.endswith(".json"):
+            continue
+        
+        path = run_dir+"/"+name+"@"+socket.gethostname()+"."+str(os.getpid())
+        try:
+            os.rename(new_dir+"/"+name, path)
+        except OSError:
+            # claimed by another worker
+            continue
+        
+        return read_json(path), path
+    
+    return None, None
+
+def run_worker():
+    global ARGS
+    
+    if not ARGS.queue_dir:
+        exit_status("Error", "work queue is not specified (-queue-dir option)")
+    
+    check_tools()
+    
+    done_dir = get_queue_dir("done")
+    claimed = {}
+    
+    # heartbeat of the worker, claims of a worker without heartbeats
+    # are returned to the queue
+    beat = get_queue_dir("beat")+"/"+socket.gethostname()+"."+str(os.getpid())
+    touch_beat(beat)
+    
+    def stop(signum, frame):
+        kill_tasks()
+        if claimed:
+            try:
+                os.rename(claimed["path"], get_queue_dir("new")+"/"+claimed["task"]["qname"]+".json")
+            except OSError:
+                # returned to the queue already
+                pass
+        if os.path.exists(beat):
+            os.remove(beat)
+        print "\nStopping worker"
+        sys.exit(ERROR_CODE["Error"])
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    print "Waiting for tasks in "+ARGS.queue_dir
+    
+    idle = time.time()
+    while not os.path.exists(ARGS.queue_dir+"/stop"):
+        task, path = claim_task()
+        
+        if task is None:
+            if ARGS.worker_idle and time.time()-idle>ARGS.worker_idle:
+                break
+            time.sleep(0.5)
+            continue
+        
+        claimed["task"] = task
+        claimed["path"] = path
+        
+        print "Running task "+task["id"]+" ("+task["kind"]+")"
+        proc = spawn_task(task)
+        
+        lost = False
+        last = time.time()
+        while not wait_task(task, proc):
+            check_timeout(task, proc)
+            time.sleep(0.1)
+            if time.time()-last>QUEUE_STALE/4:
+                touch_beat(beat)
+                last = time.time()
+                if not lost and not os.path.exists(path):
+                    # returned to the queue, another copy may run
+                    print "Task "+task["id"]+" is returned to the queue, cancelling"
+                    lost = True
+                    kill_task(proc)
+        
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno!=errno.ENOENT:
+                raise
+            lost = True
+        
+        if not lost:
+            res = {"id":task["id"], "ecode":task["ecode"], "time":task["time"], "rss":task["rss"], "killed":task["killed"], "host":socket.gethostname()}
+            write_json(done_dir+"/"+task["id"]+".json", res)
+        claimed.clear()
+        
+        idle = time.time()
+    
+    os.remove(beat)
+    sys.exit(ERROR_CODE["Ok"])
+
+def get_report_dir():
+    if ARGS.report_dir:
+        return ARGS.report_dir
+    
+    report_dir = "compat_report"
+    report_dir += "/"+PKGS_ATTR["old"]["arch"]+"/"+PKGS_ATTR["old"]["name"]
+    report_dir += "/"+PKGS_ATTR["old"]["ver"]+"/"+PKGS_ATTR["new"]["ver"]
+    
+    return report_dir
+
+def is_selected(oname):
+    if ARGS.objects:
+        if not any([fnmatch.fnmatch(oname, p) for p in ARGS.objects.split(";")]):
+            return False
+    
+    if ARGS.skip_objects:
+        if any([fnmatch.fnmatch(oname, p) for p in ARGS.skip_objects.split(";")]):
+            return False
+    
+    return True
+
+def glob_escape(path):
+    return re.sub(r"([\[\]\*\?\\])", r"\\\1", path)
+
+def get_debug_members(objects):
+    # debuginfo files of objects by build-id and by name, supplementary
+    # files of dwz
+    members = ["*/.dwz/*"]
+    for obj in objects:
+        oname = glob_escape(os.path.basename(obj))
+        bid = get_build_id(obj)
+        if bid:
+            members.append("*/.build-id/"+bid[:2]+"/"+bid[2:]+".debug")
+        members.append("*/"+oname+"*.debug")
+        members.append("*/debug/*/"+oname)
+    
+    return members
+
+def get_dump_dir(age):
+    dump_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dump_dir = ARGS.dumps_dir
+    
+    return dump_dir+"/"+PKGS_ATTR[age]["arch"]+"/"+PKGS_ATTR[age]["name"]+"/"+PKGS_ATTR[age]["ver"]
+
+def plan_run(report_dir):
+    # work of the run, from package metadata and existing reports and
+    # ABI dumps only
+    plan = {"report":os.path.exists(report_dir), "files":{}, "dumps":{}, "extract":[], "defer":False, "cost":0.0, "space":{"extract":0, "dumps":0, "pkgs":[]}}
+    if plan["report"] and not ARGS.rebuild_report:
+        return plan
+    
+    for age in ["old", "new"]:
+        plan["files"][age] = {}
+        for kind in PKGS[age]:
+            listed = []
+            for pkg in PKGS[age][kind]:
+                pfiles = list_pkg_files(pkg)
+                if pfiles is None:
+                    listed = None
+                    break
+                listed.extend(pfiles)
+            
+            if listed is not None:
+                deb_debug = (kind=="debug" and get_fmt(PKGS[age][kind].keys()[0])=="deb")
+                plan["files"][age][kind] = scan_listed(kind, listed, deb_debug)[FILE_KIND[kind]]
+        
+        dump_dir = get_dump_dir(age)
+        dumps = {"dir":dump_dir, "objects":None, "missing":None}
+        if "rel" in plan["files"][age]:
+            dumps["objects"] = sorted(set([os.path.basename(f) for f in plan["files"][age]["rel"] if is_selected(os.path.basename(f))]))
+            dumps["missing"] = [o for o in dumps["objects"] if ARGS.rebuild_dumps or not has_dump(dump_dir+"/"+o+"/ABI.dump")]
+        plan["dumps"][age] = dumps
+        
+        hist = read_history(PKGS_ATTR[age]["arch"], PKGS_ATTR[age]["name"]) or {}
+        objects = dumps["objects"] or []
+        debug_pkgs = PKGS[age].get("debug", PKGS[age]["rel"])
+        debug_size = sum([os.path.getsize(pkg) for pkg in debug_pkgs])
+        dump_size = sum([get_pkg_size(pkg) for pkg in debug_pkgs])*DUMP_SIZE_PER_BYTE
+        if dumps["objects"] is None:
+            plan["space"]["dumps"] += dump_size
+        
+        for oname in objects:
+            h = hist.get(get_history_key(oname), {})
+            dump_time = h.get("time") or debug_size*DUMP_SEC_PER_BYTE/len(objects)
+            if oname in dumps["missing"]:
+                plan["cost"] += dump_time
+                if h.get("dumps_size"):
+                    # of old and new dumps
+                    plan["space"]["dumps"] += h["dumps_size"]/2
+                else:
+                    plan["space"]["dumps"] += dump_size/len(objects)
+            if age=="old":
+                plan["cost"] += h.get("compare_time") or dump_time*COMPARE_SEC_PER_BYTE/DUMP_SEC_PER_BYTE
+    
+    # debuginfo and devel packages are needed for ABI dumping only,
+    # objects without a counterpart are likely added or removed and
+    # not dumped (the packages are extracted later if they are matched)
+    if all([plan["dumps"][age]["objects"] for age in ["old", "new"]]):
+        short = {}
+        for age in ["old", "new"]:
+            short[age] = set([get_short_name(o) or o for o in plan["dumps"][age]["objects"]])
+        
+        plan["defer"] = True
+        for age, other in [("old", "new"), ("new", "old")]:
+            for oname in plan["dumps"][age]["missing"]:
+                if (get_short_name(oname) or oname) in short[other]:
+                    plan["defer"] = False
+    
+    for age in ["old", "new"]:
+        for kind in ["rel", "debug", "devel"]:
+            if kind not in PKGS[age]:
+                continue
+            
+            pkgs = sorted(PKGS[age][kind].keys())
+            dumps = plan["dumps"][age]
+            
+            # share of debuginfo needed for the objects to dump, extracted later
+            part = 1.0
+            if dumps["objects"]:
+                part = float(len(dumps["missing"]))/len(dumps["objects"])
+            
+            space = {}
+            if kind!="rel" and plan["defer"]:
+                state = "not needed, ABI dumps exist"
+            elif kind=="debug" and ARGS.debug_store:
+                state = "extract if not found in the debug store"
+                space = dict([(pkg, get_pkg_size(pkg)*part) for pkg in pkgs])
+            elif kind=="debug" and (ARGS.objects or ARGS.skip_objects):
+                state = "extract debuginfo of selected objects"
+                space = dict([(pkg, get_pkg_size(pkg)*part) for pkg in pkgs])
+            elif kind=="rel" and (ARGS.objects or ARGS.skip_objects) and dumps["objects"] is not None:
+                state = "extract "+str(len(dumps["objects"]))+" selected object(s)"
+                objects = set(plan["files"][age]["rel"])
+                for pkg in pkgs:
+                    sizes = PROBES[("sizes", os.path.abspath(pkg))]
+                    space[pkg] = sum([sizes[f] for f in sizes if f in objects and is_selected(os.path.basename(f))])
+            elif age=="new" and is_identical(kind):
+                state = "identical to old"
+            elif kind=="devel" and pkgs==SHARED_DEVEL.get(age, {}).get("pkgs"):
+                state = "shared"
+            elif ARGS.extract_cache and all([os.path.exists(get_cache_entry(pkg)+"/files.json") for pkg in pkgs]):
+                state = "cached"
+            else:
+                state = "extract"
+                plan["cost"] += sum([os.path.getsize(pkg) for pkg in pkgs])*DUMP_SEC_PER_BYTE
+                space = dict([(pkg, get_pkg_size(pkg)) for pkg in pkgs])
+            plan["extract"].append((age, kind, pkgs, state))
+            
+            for pkg in space:
+                plan["space"]["extract"] += space[pkg]
+                plan["space"]["pkgs"].append((age, kind, pkg, space[pkg]))
+    
+    return plan
+
+def print_plan(plan, report_dir):
+    if plan["report"] and not ARGS.rebuild_report:
+        print "The report already exists: "+report_dir
+        print "Nothing to do"
+        return
+    
+    if plan["report"]:
+        print "Report: "+report_dir+" (rebuild)"
+    else:
+        print "Report: "+report_dir
+    
+    for age, kind, pkgs, state in plan["extract"]:
+        print "Package "+kind+" ("+age+"): "+", ".join([os.path.basename(p) for p in pkgs])+" - "+state
+    
+    if ARGS.debug_store:
+        print "Debug store: "+ARGS.debug_store
+    
+    for age in ["old", "new"]:
+        dumps = plan["dumps"][age]
+        if dumps["objects"] is None:
+            print "ABI dumps ("+age+"): "+dumps["dir"]+" - can't list objects without extraction"
+        else:
+            print "ABI dumps ("+age+"): "+dumps["dir"]+" - "+str(len(dumps["objects"]))+" object(s), "+str(len(dumps["missing"]))+" to create"
+    
+    print "Disk space: "+format_size(plan["space"]["extract"])+" for extraction, "+format_size(plan["space"]["dumps"])+" for ABI dumps"
+    print "Estimated time: "+format_num(plan["cost"]/max(ARGS.jobs, 1))+" sec"
+
+def get_run_key():
+    key = {}
+    for k in ["old", "new"]:
+        key[k] = sorted([os.path.abspath(p) for p in vars(ARGS)[k]])
+    for k in ["bin", "src", "objects", "skip_objects", "dumps_dir", "ignore_tags", "use_tu_dump", "include_preamble", "include_paths", "keep_registers_and_offsets", "quiet"]:
+        key[k] = vars(ARGS)[k]
+    
+    return json.dumps(key, sort_keys=True)
+
+def open_journal(part_dir):
+    # The journal lists completed stages of a run, one JSON object per line.
+    # The report is built in part_dir and moved into place when complete.
+    global JOURNAL, TMP_DIR, TMP_DIR_INT
+    
+    path = part_dir+"/journal"
+    done = {}
+    
+    if ARGS.resume and os.path.exists(path):
+        for line in open(path, "r"):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # interrupted while writing
+                continue
+            done[entry["stage"]+"/"+entry["key"]] = entry.get("data")
+        
+        if done.get("run/args")!=get_run_key():
+            print "WARNING: the interrupted run used different packages or options, starting over"
+            done = {}
+        else:
+            print "Resuming the interrupted run"
+    
+    if not done and os.path.exists(part_dir):
+        # the workspace of the interrupted run
+        if os.path.exists(path):
+            for line in open(path, "r"):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                ws = entry.get("data")
+                if entry["stage"]=="workspace" and ws!=TMP_DIR and os.path.isdir(str(ws)+"/PKG_ABIDIFF_TMP"):
+                    chmod_777(ws+"/PKG_ABIDIFF_TMP")
+                    shutil.rmtree(ws+"/PKG_ABIDIFF_TMP")
+                    try:
+                        # not a -tmp-dir given by the user
+                        os.rmdir(ws)
+                    except OSError:
+                        pass
+        shutil.rmtree(part_dir)
+    
+    if not os.path.exists(part_dir):
+        os.makedirs(part_dir)
+    
+    JOURNAL = {"path":path, "done":done}
+    
+    if not done:
+        journal_add("run", "args", get_run_key())
+    
+    ws = done.get("workspace/tmp")
+    if ws and ws!=TMP_DIR and os.path.isdir(ws) and not ARGS.tmp_dir:
+        shutil.rmtree(TMP_DIR)
+        TMP_DIR = ws
+        TMP_DIR_INT = TMP_DIR+"/PKG_ABIDIFF_TMP"
+    
+    journal_add("workspace", "tmp", TMP_DIR)
+
+def journal_add(stage, key, data=None):
+    JOURNAL["done"][stage+"/"+key] = data
+    with open(JOURNAL["path"], "a") as f:
+        f.write(json.dumps({"stage":stage, "key":key, "data":data})+"\n")
+
+def journal_has(stage, key):
+    return JOURNAL is not None and stage+"/"+key in JOURNAL["done"]
+
+def journal_get(stage, key):
+    return JOURNAL["done"].get(stage+"/"+key)
+
+def finalize_report(part_dir, report_dir):
+    global JOURNAL
+    
+    os.remove(JOURNAL["path"])
+    JOURNAL = None
+    
+    if os.path.exists(report_dir):
+        old_dir = report_dir+".old"
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        os.rename(report_dir, old_dir)
+        os.rename(part_dir, report_dir)
+        shutil.rmtree(old_dir)
+    else:
+        parent = os.path.dirname(report_dir)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        os.rename(part_dir, report_dir)
+
+def check_tools():
+    global ABI_CC, ABI_DUMPER
+    
+    if not check_cmd(ABI_CC):
+        exit_status("Error", "ABI Compliance Checker "+ABI_CC_VER+" or newer is not installed")
+    
+    if cmp_vers(get_dumpversion(ABI_CC), ABI_CC_VER)<0:
+        exit_status("Error", "the version of ABI Compliance Checker should be "+ABI_CC_VER+" or newer")
+    
+    if not check_cmd(ABI_DUMPER):
+        exit_status("Error", "ABI Dumper "+ABI_DUMPER_VER+" or newer is not installed")
+    
+    if cmp_vers(get_dumpversion(ABI_DUMPER), ABI_DUMPER_VER)<0:
+        exit_status("Error", "the version of ABI Dumper should be "+ABI_DUMPER_VER+" or newer")
+
+def init_tmp_dir():
+    global TMP_DIR, TMP_DIR_INT
+    if ARGS.tmp_dir:
+        TMP_DIR = ARGS.tmp_dir
+    elif ARGS.queue_dir:
+        # workers need to see extracted files
+        TMP_DIR = tempfile.mkdtemp(dir=get_queue_dir("work"))
+    else:
+        TMP_DIR = tempfile.mkdtemp()
+    
+    TMP_DIR_INT = TMP_DIR+"/PKG_ABIDIFF_TMP"
+    if not os.path.exists(TMP_DIR_INT):
+        os.makedirs(TMP_DIR_INT)
+
+def get_job_key(cwd, args):
+    key = {"cwd":cwd}
+    for k, v in vars(args).items():
+        if k in ["old", "new"] and v:
+            v = sorted([os.path.normpath(os.path.join(cwd, p)) for p in v])
+        key[k] = v
+    
+    return json.dumps(key, sort_keys=True)
+
+def send_msg(sock, msg):
+    try:
+        sock.sendall(json.dumps(msg)+"\n")
+        return True
+    except socket.error:
+        return False
+
+def start_job(job, srv, clients):
+    global ARGS
+    
+    fd, job["dumps"] = tempfile.mkstemp(prefix="dumps-")
+    os.close(fd)
+    
+    r, w = os.pipe()
+    pid = os.fork()
+    
+    if pid:
+        os.close(w)
+        job["pid"] = pid
+        job["fd"] = r
+        job["status"] = "running"
+        return
+    
+    # child
+    os.close(r)
+    srv.close()
+    for sock in clients:
+        sock.close()
+    
+    os.dup2(w, 1)
+    os.dup2(w, 2)
+    os.close(w)
+    # unbuffered streams on copies of fds 1 and 2: replaced streams are
+    # closed when collected, this must not close fds 1 and 2 inherited
+    # by tasks (groups of a daemon job replace the streams of the job)
+    sys.stdout = os.fdopen(os.dup(1), "w", 0)
+    sys.stderr = os.fdopen(os.dup(2), "w", 0)
+    
+    signal.signal(signal.SIGINT, int_exit)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    
+    code = ERROR_CODE["Error"]
+    try:
+        # jobs add to the metrics and results of the daemon
+        if ARGS.metrics_file and not job["args"].metrics_file:
+            job["args"].metrics_file = os.path.abspath(ARGS.metrics_file)
+        if ARGS.results_db and not job["args"].results_db:
+            job["args"].results_db = os.path.abspath(ARGS.results_db)
+        reset_metrics()
+        DUMP_INDEX["log"] = job["dumps"]
+        os.chdir(job["cwd"])
+        ARGS = job["args"]
+        init_tmp_dir()
+        run_compare()
+    except SystemExit as e:
+        code = e.code
+    except Exception:
+        print traceback.format_exc()
+        try:
+            s_exit("Error")
+        except SystemExit as e:
+            code = e.code
+    
+    os._exit(code)
+
+def finish_job(job):
+    os.close(job["fd"])
+    status = os.waitpid(job["pid"], 0)[1]
+    
+    if os.WIFEXITED(status):
+        job["exit"] = os.WEXITSTATUS(status)
+    else:
+        job["exit"] = ERROR_CODE["Error"]
+    
+    job["status"] = "done"
+    
+    # pick up dumps created by the job
+    with open(job["dumps"]) as f:
+        DUMP_INDEX["dumps"].update(f.read().splitlines())
+    os.remove(job["dumps"])
+    
+    for sock in job["clients"]:
+        send_msg(sock, {"status":"done", "exit":job["exit"]})
+
+def serve(path):
+    # Protocol: a client sends one JSON line {"cwd": DIR, "argv": [ARGS]}
+    # and receives JSON lines {"status": ...}, {"out": TEXT} and finally
+    # {"status": "done", "exit": CODE}. Identical jobs that are already
+    # queued or running are shared between clients.
+    check_tools()
+    
+    for prog in ["rpm", "rpm2cpio", "dpkg"]:
+        check_cmd(prog)
+    
+    if check_cmd(CTAGS):
+        get_version(CTAGS)
+    
+    dumps_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dumps_dir = ARGS.dumps_dir
+    load_dump_index(dumps_dir)
+    
+    if os.path.exists(path):
+        os.remove(path)
+    
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(path)
+    srv.listen(16)
+    
+    def stop(signum, frame):
+        for job in jobs.values():
+            if job["status"]=="running":
+                os.kill(job["pid"], signal.SIGINT)
+        srv.close()
+        os.remove(path)
+        sys.exit(ERROR_CODE["Ok"])
+    
+    jobs = {}
+    queue = []
+    job_n = 0
+    clients = {}
+    
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    
+    print "Listening on "+path
+    
+    while True:
+        rlist = [srv]+clients.keys()
+        running = {}
+        for job in jobs.values():
+            if job["status"]=="running":
+                running[job["fd"]] = job
+        rlist.extend(running.keys())
+        
+        try:
+            ready = select.select(rlist, [], [], 1)[0]
+        except select.error:
+            continue
+        
+        for r in ready:
+            if r is srv:
+                sock = srv.accept()[0]
+                clients[sock] = ""
+            elif r in clients:
+                data = r.recv(65536)
+                if not data:
+                    del clients[r]
+                    r.close()
+                    continue
+                
+                clients[r] += data
+                if clients[r].find("\n")==-1:
+                    continue
+                
+                req = clients.pop(r)
+                try:
+                    req = json.loads(req.split("\n")[0])
+                    cwd = req["cwd"]
+                    args = init_options(req["argv"])
+                except (ValueError, KeyError, TypeError, SystemExit):
+                    send_msg(r, {"status":"done", "exit":ERROR_CODE["Error"], "out":"ERROR: invalid request\n"})
+                    r.close()
+                    continue
+                
+                if args.serve or args.submit:
+                    send_msg(r, {"status":"done", "exit":ERROR_CODE["Error"], "out":"ERROR: nested daemon requests are not allowed\n"})
+                    r.close()
+                    continue
+                
+                key = get_job_key(cwd, args)
+                if key in jobs:
+                    job = jobs[key]
+                    send_msg(r, {"status":job["status"], "job":job["id"], "shared":True})
+                    send_msg(r, {"out":job["out"]})
+                else:
+                    job_n += 1
+                    job = {"id":job_n, "cwd":cwd, "args":args, "out":"", "clients":[], "status":"queued"}
+                    jobs[key] = job
+                    queue.append(key)
+                    send_msg(r, {"status":"queued", "job":job["id"]})
+                
+                job["clients"].append(r)
+            else:
+                job = running[r]
+                data = os.read(r, 65536)
+                if data:
+                    job["out"] += data
+                    job["clients"] = [sock for sock in job["clients"] if send_msg(sock, {"out":data})]
+                else:
+                    finish_job(job)
+                    for sock in job["clients"]:
+                        sock.close()
+                    for key in jobs.keys():
+                        if jobs[key] is job:
+                            del jobs[key]
+        
+        nrunning = len([job for job in jobs.values() if job["status"]=="running"])
+        while queue and nrunning<(ARGS.max_jobs or 1):
+            job = jobs[queue.pop(0)]
+            start_job(job, srv, clients.keys()+[sock for j in jobs.values() for sock in j["clients"]])
+            job["clients"] = [sock for sock in job["clients"] if send_msg(sock, {"status":"running"})]
+            nrunning += 1
+
+def submit_job(path):
+    argv = []
+    skip = False
+    for arg in sys.argv[1:]:
+        if skip:
+            skip = False
+        elif arg in ["-submit", "--submit"]:
+            skip = True
+        elif not arg.startswith("-submit="):
+            argv.append(arg)
+    
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        print_err("ERROR: can't connect to "+path+": "+str(e))
+        sys.exit(ERROR_CODE["Error"])
+    
+    send_msg(sock, {"cwd":os.getcwd(), "argv":argv})
+    
+    code = ERROR_CODE["Error"]
+    for line in sock.makefile("r"):
+        msg = json.loads(line)
+        if "out" in msg:
+            sys.stdout.write(msg["out"])
+            sys.stdout.flush()
+        if "exit" in msg:
+            code = msg["exit"]
+    
+    sock.close()
+    sys.exit(code)
+
+def get_arch_groups():
+    # packages of several architectures are compared per architecture,
+    # noarch packages are added to each of them
+    groups = {}
+    noarch = {"old":[], "new":[]}
+    
+    for age in ["old", "new"]:
+        for pkg in vars(ARGS)[age] or []:
+            if not os.path.isfile(pkg):
+                return None
+            
+            attrs = get_attrs(pkg)
+            if not attrs:
+                return None
+            
+            if attrs[2] in NOARCH:
+                noarch[age].append(pkg)
+            else:
+                if attrs[2] not in groups:
+                    groups[attrs[2]] = {"old":[], "new":[]}
+                groups[attrs[2]][age].append(pkg)
+    
+    if len(groups)<2:
+        return None
+    
+    for arch in groups:
+        for age in ["old", "new"]:
+            groups[arch][age].extend(noarch[age])
+    
+    return groups
+
+def start_group_job(label, group):
+    global ARGS
+    
+    sys.stdout.flush()
+    r, w = os.pipe()
+    pid = os.fork()
+    
+    if pid:
+        os.close(w)
+        return {"label":label, "pid":pid, "fd":r, "out":""}
+    
+    # child
+    signal.signal(signal.SIGUSR1, cancel_exit)
+    os.close(r)
+    os.dup2(w, 1)
+    os.dup2(w, 2)
+    os.close(w)
+    # unbuffered streams on copies of fds 1 and 2: replaced streams are
+    # closed when collected, this must not close fds 1 and 2 inherited
+    # by tasks (groups of a daemon job replace the streams of the job)
+    sys.stdout = os.fdopen(os.dup(1), "w", 0)
+    sys.stderr = os.fdopen(os.dup(2), "w", 0)
+    
+    code = ERROR_CODE["Error"]
+    try:
+        ARGS = argparse.Namespace(**vars(ARGS))
+        ARGS.old = group["old"]
+        ARGS.new = group["new"]
+        EVENT_TAGS["group"] = label
+        reset_metrics()
+        ARGS.tmp_dir = None
+        ARGS.old_repo = None
+        ARGS.new_repo = None
+        if ARGS.report_dir:
+            ARGS.report_dir += "/"+label
+        init_tmp_dir()
+        compare_pkgs()
+    except SystemExit as e:
+        code = e.code
+    except Exception:
+        print traceback.format_exc()
+        try:
+            s_exit("Error")
+        except SystemExit as e:
+            code = e.code
+    
+    os._exit(code)
 
-def get_dumpversion(prog):
-    ver = subprocess.check_output([prog, "-dumpversion"])
-    return ver.rstrip()
+def start_local_worker():
+    global TMP_DIR, TMP_DIR_INT
+    
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+    
+    # the workspace belongs to the parent
+    TMP_DIR = None
+    TMP_DIR_INT = None
+    
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    
+    try:
+        run_worker()
+    except SystemExit:
+        pass
+    
+    os._exit(0)
 
-def get_version(prog):
-    ver = subprocess.check_output([prog, "--version"])
-    return ver.rstrip()
+def run_groups(groups, limit):
+    # Each group of packages is compared by a child process, children
+    # submit their tasks to one work queue. Returns exit codes and report
+    # directories of the groups.
+    workers = []
+    if not ARGS.queue_dir:
+        ARGS.queue_dir = TMP_DIR_INT+"/queue"
+        for i in range(0, max(ARGS.jobs, 1)):
+            workers.append(start_local_worker())
+    
+    queue = sorted(groups.keys())
+    running = {}
+    codes = {}
+    reports = {}
+    cancelled = False
+    
+    while queue or running:
+        while queue and len(running)<limit:
+            label = queue.pop(0)
+            job = start_group_job(label, groups[label])
+            running[job["fd"]] = job
+        
+        for r in select.select(running.keys(), [], [])[0]:
+            job = running[r]
+            data = os.read(r, 65536)
+            if data:
+                job["out"] += data
+                lines = job["out"].split("\n")
+                job["out"] = lines.pop()
+                for line in lines:
+                    print "["+job["label"]+"] "+line
+                    m = re.match(r"(The report has been generated to|The report already exists): (.+?)(/index\.html)?\Z", line)
+                    if m and os.path.exists(m.group(2)+"/meta.json"):
+                        reports[job["label"]] = m.group(2)
+                continue
+            
+            os.close(r)
+            del running[r]
+            status = os.waitpid(job["pid"], 0)[1]
+            if os.WIFEXITED(status):
+                codes[job["label"]] = os.WEXITSTATUS(status)
+            else:
+                codes[job["label"]] = ERROR_CODE["Error"]
+            
+            if ARGS.fail_fast and codes[job["label"]]==ERROR_CODE["Break"] and not cancelled:
+                # cancel other groups, the ones not started yet too
+                cancelled = True
+                for label in queue:
+                    codes[label] = ERROR_CODE["Cancelled"]
+                queue = []
+                for other in running.values():
+                    os.kill(other["pid"], signal.SIGUSR1)
+    
+    if workers:
+        write_file(ARGS.queue_dir+"/stop", "")
+        for pid in workers:
+            os.waitpid(pid, 0)
+    
+    return codes, reports
 
-def cmp_vers(x, y):
-    xp = x.split(".")
-    yp = y.split(".")
+def run_multiarch(groups):
+    global PKGS, FILES
     
-    for k in range(len(xp), max(len(xp), len(yp))):
-        xp.append("0")
+    check_tools()
     
-    for k in range(len(yp), max(len(xp), len(yp))):
-        yp.append("0")
+    arches = groups.keys()
+    arches.sort()
+    print "Comparing packages for "+", ".join(arches)+" architectures ..."
     
-    for k in range(0, len(xp)):
-        a = xp[k]
-        b = yp[k]
+    # noarch devel packages are extracted and scanned once for all architectures
+    tasks = []
+    for age in ["old", "new"]:
+        devel = {}
+        for arch in arches:
+            devel[arch] = [p for p in groups[arch][age] if get_pkg_kind(os.path.basename(p))=="devel"]
         
-        if a==b:
+        pkgs = sorted(devel[arches[0]])
+        if not pkgs or any([sorted(devel[arch])!=pkgs for arch in arches]):
             continue
         
-        if(int(a) > int(b)):
-            return 1
+        PKGS[age] = {"devel":dict.fromkeys(pkgs, 1)}
+        e_dir, e_tasks = extract_pkgs(age, "devel")
+        SHARED_DEVEL[age] = {"pkgs":pkgs, "dir":os.path.abspath(e_dir)}
+        tasks.extend(e_tasks)
+    
+    if tasks:
+        print "Extracting noarch devel packages ..."
+    
+    for task in run_tasks(tasks):
+        if is_failed(task):
+            exit_status("Error", "failed to extract package "+task["package"]+" ("+get_task_error(task)+")")
+    
+    for age in SHARED_DEVEL:
+        FILES[age] = {"object":[], "debuginfo":[], "header":[], "count":{}}
+        if ARGS.extract_cache:
+            link_from_cache(age, "devel", SHARED_DEVEL[age]["dir"])
         else:
-            return -1
+            classify_files(age, "devel", SHARED_DEVEL[age]["dir"])
+        SHARED_DEVEL[age]["header"] = FILES[age]["header"]
+        SHARED_DEVEL[age]["count"] = FILES[age]["count"]["devel"]
     
-    return 0
+    codes, reports = run_groups(groups, len(arches))
+    
+    if reports:
+        report_dir = write_multiarch_report(arches, reports, codes)
+        print "The cross-arch summary has been generated to: "+report_dir+"/index.html"
+    
+    if ARGS.fail_fast and ERROR_CODE["Break"] in codes.values():
+        s_exit("Break")
+    
+    if any([codes[arch] not in [ERROR_CODE["Ok"], ERROR_CODE["Partial"]] for arch in arches]):
+        exit_status("Error", "failed to compare packages for "+", ".join([arch for arch in arches if codes[arch] not in [ERROR_CODE["Ok"], ERROR_CODE["Partial"]]]))
+    
+    if ERROR_CODE["Partial"] in codes.values():
+        s_exit("Partial")
+    
+    s_exit("Ok")
 
-def get_dump_attr(path):
-    attr = {}
-    attr["empty"] = False
-    attr["lang"] = None
-    f = open(path, 'r')
-    for line in f:
-        if line.find("'Language' =>")!=-1:
-            m = re.search(r"'Language' => '(.+)'", line)
+def write_multiarch_report(arches, reports, codes):
+    meta = {}
+    for arch in reports:
+        meta[arch] = json.loads(read_file(reports[arch]+"/meta.json"), object_pairs_hook=collections.OrderedDict)
+    
+    first = meta[sorted(meta.keys())[0]]
+    
+    if ARGS.report_dir:
+        report_dir = ARGS.report_dir
+    else:
+        report_dir = "compat_report/multiarch/"+first["Package"]+"/"+first["Version1"]+"/"+first["Version2"]
+    
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    
+    # an object breaks in some of the architectures and not in others
+    objects = {}
+    found = {}
+    for arch in meta:
+        for o in meta[arch]["Objects"]:
+            found.setdefault(o["Object"], set()).add(arch)
+            if o["Status"]=="added":
+                continue
+            if o["Object"] not in objects:
+                objects[o["Object"]] = {}
+            
+            res = collections.OrderedDict()
+            res["Status"] = o["Status"]
+            if o["Status"]=="compared":
+                if "BC" in o:
+                    res["BC"] = o["BC"]
+                else:
+                    res["BC"] = o["Source_BC"]
+                res["Report"] = os.path.relpath(reports[arch]+"/"+o.get("Report", o.get("Source_Report")), report_dir)
+            res["Broken"] = (o["Status"]=="removed" or res.get("BC", 100)<100)
+            objects[o["Object"]][arch] = res
+    
+    summary = collections.OrderedDict()
+    summary["Package"] = first["Package"]
+    summary["Version1"] = first["Version1"]
+    summary["Version2"] = first["Version2"]
+    summary["Arches"] = collections.OrderedDict()
+    for arch in arches:
+        a = collections.OrderedDict()
+        a["Exit"] = codes[arch]
+        if codes[arch]==ERROR_CODE["Cancelled"]:
+            a["Status"] = "cancelled"
+        if arch in meta:
+            for k in ["BC", "Source_BC", "Added", "Removed", "ObjectsRemoved", "ObjectsFailed"]:
+                if k in meta[arch]:
+                    a[k] = meta[arch][k]
+            a["Report"] = os.path.relpath(reports[arch]+"/index.html", report_dir)
+        summary["Arches"][arch] = a
+    
+    summary["Objects"] = []
+    for obj in sorted(objects.keys(), key=lambda x: x.lower()):
+        o = collections.OrderedDict()
+        o["Object"] = obj
+        broken = [arch for arch in objects[obj] if objects[obj][arch]["Broken"]]
+        # breaks in some of the architectures having the object
+        o["ArchSpecific"] = bool(broken) and (len(broken)<len(objects[obj]))
+        o["Missing"] = sorted([arch for arch in meta if arch not in found[obj]])
+        o["Arches"] = collections.OrderedDict()
+        for arch in sorted(objects[obj].keys()):
+            o["Arches"][arch] = objects[obj][arch]
+        summary["Objects"].append(o)
+    
+    with open(report_dir+"/meta.json", "w") as f:
+        json.dump(summary, f, indent=2, separators=(",", ": "))
+        f.write("\n")
+    
+    write_multiarch_html(report_dir+"/index.html", summary, arches)
+    
+    return report_dir
+
+def read_pkg_info(path):
+    # attributes of a package file with the name of its source package
+    fmt = get_fmt(path)
+    info = {"path":path, "kind":get_pkg_kind(os.path.basename(path))}
+    
+    if fmt=="rpm":
+        r = subprocess.check_output(["rpm", "-qp", "--queryformat", "%{name},%{version},%{release},%{arch},%{sourcerpm}", path])
+        name, ver, rl, arch, srpm = r.split(",")
+        info.update({"name":name, "ver":ver+"-"+rl, "arch":arch, "src":re.sub(r"-[^-]+-[^-]+\.src\.rpm\Z", "", srpm)})
+        if info["src"]=="(none)":
+            info["src"] = name
+    elif fmt=="deb":
+        r = subprocess.check_output(["dpkg", "-f", path, "Package", "Version", "Architecture", "Source"])
+        attr = {}
+        for line in r.split("\n"):
+            m = re.match(r"(\w+)\s*:\s*(.+)", line)
             if m:
-                attr["lang"] = m.group(1)
-        elif line.find("'SymbolInfo' =>")!=-1:
-            attr["empty"] = (line.find("'SymbolInfo' => {}")!=-1)
-            break
+                attr[m.group(1)] = m.group(2)
+        info.update({"name":attr["Package"], "ver":attr["Version"], "arch":attr["Architecture"]})
+        info["src"] = attr.get("Source", attr["Package"]).split(" ")[0]
+    else:
+        attrs = get_attrs(path)
+        if not attrs:
+            return None
+        info.update({"name":attrs[0], "ver":attrs[1], "arch":attrs[2], "src":attrs[0]})
     
-    f.close()
-    return attr
+    return info
 
-def count_symbols(path, obj, age):
-    global ABI_CC
-    print "Counting symbols in the ABI dump for "+os.path.basename(obj)+" ("+age+")"
-    count = subprocess.check_output([ABI_CC, "-count-symbols", path])
-    return int(count.rstrip())
+def read_repodata(top):
+    # rpm-md primary metadata
+    ns = {"c":"http://linux.duke.edu/metadata/common", "rpm":"http://linux.duke.edu/metadata/rpm", "r":"http://linux.duke.edu/metadata/repo"}
+    
+    repomd = ElementTree.parse(top+"/repodata/repomd.xml")
+    href = repomd.find("r:data[@type='primary']/r:location", ns).get("href")
+    
+    pkgs = []
+    with gzip.open(top+"/"+href) as f:
+        for event, elem in ElementTree.iterparse(f):
+            if elem.tag!="{"+ns["c"]+"}package":
+                continue
+            
+            v = elem.find("c:version", ns)
+            path = top+"/"+elem.find("c:location", ns).get("href")
+            srpm = elem.findtext("c:format/rpm:sourcerpm", "", ns) or ""
+            name = elem.find("c:name", ns).text
+            
+            pkgs.append({"path":path, "kind":get_pkg_kind(os.path.basename(path)), "name":name, "ver":v.get("ver")+"-"+v.get("rel"), "arch":elem.find("c:arch", ns).text, "src":re.sub(r"-[^-]+-[^-]+\.src\.rpm\Z", "", srpm) or name})
+            elem.clear()
+    
+    return pkgs
 
-def read_bytes(path):
-    fp = open(path, 'rb')
-    buf = fp.read()
-    fp.close()
-    return binascii.b2a_hex(buf[0:4])
+def read_deb_packages(top, index):
+    # Packages index of a Debian repository
+    if index.endswith(".gz"):
+        content = gzip.open(index).read()
+    else:
+        content = read_file(index)
+    
+    pkgs = []
+    for para in content.split("\n\n"):
+        attr = {}
+        for line in para.split("\n"):
+            m = re.match(r"(\w[\w\-]*)\s*:\s*(.+)", line)
+            if m:
+                attr[m.group(1)] = m.group(2)
+        
+        if "Filename" not in attr:
+            continue
+        
+        path = top+"/"+attr["Filename"]
+        pkgs.append({"path":path, "kind":get_pkg_kind(os.path.basename(path)), "name":attr["Package"], "ver":attr["Version"], "arch":attr["Architecture"], "src":attr.get("Source", attr["Package"]).split(" ")[0]})
+    
+    return pkgs
 
-def chmod_777(path):
-    subprocess.call(["chmod", "777", "-R", path])
+def index_repo(top):
+    if os.path.exists(top+"/repodata/repomd.xml"):
+        return read_repodata(top)
+    
+    for name in ["Packages.gz", "Packages"]:
+        if os.path.exists(top+"/"+name):
+            return read_deb_packages(top, top+"/"+name)
+    
+    # no metadata, read packages
+    pkgs = []
+    for f, fpath in list_files(top):
+        if get_fmt(f) in ["rpm", "deb"] and not f.endswith(".src.rpm"):
+            info = read_pkg_info(fpath)
+            if info:
+                pkgs.append(info)
+    
+    return pkgs
+
+def get_repo_units(pkgs):
+    # A unit is a release package with its debuginfo package and devel
+    # packages of the same source package and architecture
+    by_src = {}
+    for p in pkgs:
+        if p["src"] not in by_src:
+            by_src[p["src"]] = []
+        by_src[p["src"]].append(p)
+    
+    units = {}
+    for src in by_src:
+        for p in by_src[src]:
+            if p["kind"]!="rel" or p["arch"] in NOARCH:
+                continue
+            
+            if p["name"].endswith("-debugsource"):
+                # sources of debuginfo, no objects
+                continue
+            
+            debug = [d for d in by_src[src] if d["kind"]=="debug" and d["arch"]==p["arch"]]
+            own = [d for d in debug if d["name"] in [p["name"]+"-debuginfo", p["name"]+"-dbgsym", p["name"]+"-dbg"]]
+            if own:
+                debug = own
+            
+            unit = {"src":src, "rel":p, "debug":None, "devel":[]}
+            if len(debug)==1:
+                unit["debug"] = debug[0]
+            
+            unit["devel"] = [d for d in by_src[src] if d["kind"]=="devel" and d["arch"] in [p["arch"]]+NOARCH]
+            units[p["name"]+"/"+p["arch"]] = unit
+    
+    return units
+
+def run_repos():
+    check_tools()
+    
+    if not ARGS.old_repo or not ARGS.new_repo:
+        exit_status("Error", "both -old-repo and -new-repo should be specified")
+    
+    units = {}
+    for age, top in [("old", ARGS.old_repo), ("new", ARGS.new_repo)]:
+        if not os.path.isdir(top):
+            exit_status("Error", "can't access '"+top+"'")
+        print "Indexing "+age+" repository "+top+" ..."
+        units[age] = get_repo_units(index_repo(top))
+    
+    groups = {}
+    summary = {}
+    for label in sorted(set(units["old"].keys()+units["new"].keys())):
+        old = units["old"].get(label)
+        new = units["new"].get(label)
+        
+        res = {"label":label}
+        if old:
+            res["name"] = old["rel"]["name"]
+            res["arch"] = old["rel"]["arch"]
+            res["ver1"] = old["rel"]["ver"]
+        if new:
+            res["name"] = new["rel"]["name"]
+            res["arch"] = new["rel"]["arch"]
+            res["ver2"] = new["rel"]["ver"]
+        summary[label] = res
+        
+        if not old:
+            res["status"] = "added"
+        elif not new:
+            res["status"] = "removed"
+        elif old["rel"]["ver"]==new["rel"]["ver"]:
+            res["status"] = "unchanged"
+        elif (not old["debug"] or not new["debug"]) and not ARGS.debug_store:
+            res["status"] = "skipped"
+            res["reason"] = "no debuginfo package"
+        else:
+            group = {}
+            for age, unit in [("old", old), ("new", new)]:
+                group[age] = [unit["rel"]["path"]]+[d["path"] for d in [unit["debug"]]+unit["devel"] if d]
+            groups[label] = group
+    
+    n = {}
+    for label in summary:
+        st = summary[label].get("status", "changed")
+        n[st] = n.get(st, 0)+1
+    print "Found "+", ".join([str(n[st])+" "+st for st in sorted(n.keys())])+" package(s)"
+    
+    codes, reports = run_groups(groups, ARGS.max_jobs or 2*max(ARGS.jobs, 1))
+    
+    for label in groups:
+        res = summary[label]
+        res["exit"] = codes[label]
+        if codes[label] in [ERROR_CODE["Empty"], ERROR_CODE["NoDebug"], ERROR_CODE["NoABI"]]:
+            res["status"] = "skipped"
+            res["reason"] = [k for k in ERROR_CODE if ERROR_CODE[k]==codes[label]][0]
+        elif codes[label]==ERROR_CODE["Cancelled"]:
+            res["status"] = "cancelled"
+        elif label in reports:
+            res["status"] = "compared"
+            res["report"] = reports[label]
+        else:
+            res["status"] = "failed"
+    
+    report_dir = write_repo_report(summary)
+    print "The repository report has been generated to: "+report_dir+"/index.html"
+    
+    if ARGS.fail_fast and ERROR_CODE["Break"] in codes.values():
+        s_exit("Break")
+    
+    if any([summary[label]["status"]=="failed" for label in summary]):
+        s_exit("Partial")
+    
+    s_exit("Ok")
+
+def write_repo_report(summary):
+    if ARGS.report_dir:
+        report_dir = ARGS.report_dir
+    else:
+        names = [os.path.basename(os.path.normpath(os.path.abspath(top))) for top in [ARGS.old_repo, ARGS.new_repo]]
+        report_dir = "compat_report/repo/"+names[0]+"/"+names[1]
+    
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    
+    meta = collections.OrderedDict()
+    meta["OldRepo"] = ARGS.old_repo
+    meta["NewRepo"] = ARGS.new_repo
+    meta["Packages"] = []
+    
+    for label in sorted(summary.keys()):
+        res = summary[label]
+        p = collections.OrderedDict()
+        p["Package"] = res["name"]
+        p["Arch"] = res["arch"]
+        for k, key in [("ver1", "Version1"), ("ver2", "Version2")]:
+            if k in res:
+                p[key] = res[k]
+        p["Status"] = res["status"]
+        if "reason" in res:
+            p["Reason"] = res["reason"]
+        if "exit" in res:
+            p["Exit"] = res["exit"]
+        if "report" in res:
+            m = json.loads(read_file(res["report"]+"/meta.json"))
+            for k in ["BC", "Source_BC", "Added", "Removed", "ObjectsRemoved"]:
+                if k in m:
+                    p[k] = m[k]
+            p["Report"] = os.path.relpath(res["report"]+"/index.html", report_dir)
+        meta["Packages"].append(p)
+    
+    with open(report_dir+"/meta.json", "w") as f:
+        json.dump(meta, f, indent=2, separators=(",", ": "))
+        f.write("\n")
+    
+    write_repo_html(report_dir+"/index.html", meta)
+    
+    return report_dir
 
 def scenario():
     signal.signal(signal.SIGINT, int_exit)
@@ -442,35 +4160,49 @@ def scenario():
     global ARGS
     ARGS = init_options()
     
-    global TMP_DIR, TMP_DIR_INT
-    if ARGS.tmp_dir:
-        TMP_DIR = ARGS.tmp_dir
-    else:
-        TMP_DIR = tempfile.mkdtemp()
+    if ARGS.submit:
+        submit_job(ARGS.submit)
     
-    TMP_DIR_INT = TMP_DIR+"/PKG_ABIDIFF_TMP"
-    if not os.path.exists(TMP_DIR_INT):
-        os.makedirs(TMP_DIR_INT)
+    if ARGS.serve:
+        serve(ARGS.serve)
     
-    if not ARGS.old:
-        exit_status("Error", "old packages are not specified (-old option)")
+    if ARGS.worker:
+        run_worker()
     
-    if not ARGS.new:
-        exit_status("Error", "new packages are not specified (-new option)")
+    if ARGS.query_symbol:
+        query_symbol(ARGS.query_symbol)
     
-    global ABI_CC, ABI_DUMPER, CTAGS
+    if ARGS.query_results:
+        query_results(ARGS.query_results)
     
-    if not check_cmd(ABI_CC):
-        exit_status("Error", "ABI Compliance Checker "+ABI_CC_VER+" or newer is not installed")
+    if ARGS.compact_dump:
+        write_compact_dump(os.path.abspath(ARGS.compact_dump))
+        s_exit("Ok")
     
-    if cmp_vers(get_dumpversion(ABI_CC), ABI_CC_VER)<0:
-        exit_status("Error", "the version of ABI Compliance Checker should be "+ABI_CC_VER+" or newer")
+    init_tmp_dir()
+    run_compare()
+
+def run_compare():
+    # two repositories, packages of several architectures or one package
+    if ARGS.old_repo or ARGS.new_repo:
+        run_repos()
     
-    if not check_cmd(ABI_DUMPER):
-        exit_status("Error", "ABI Dumper "+ABI_DUMPER_VER+" or newer is not installed")
+    groups = get_arch_groups()
+    if groups:
+        run_multiarch(groups)
     
-    if cmp_vers(get_dumpversion(ABI_DUMPER), ABI_DUMPER_VER)<0:
-        exit_status("Error", "the version of ABI Dumper should be "+ABI_DUMPER_VER+" or newer")
+    compare_pkgs()
+
+def compare_pkgs():
+    global ARGS, JOURNAL
+    
+    if not ARGS.old:
+        exit_status("Error", "old packages are not specified (-old option)")
+    
+    if not ARGS.new:
+        exit_status("Error", "new packages are not specified (-new option)")
+    
+    check_tools()
     
     if not ARGS.bin and not ARGS.src:
         ARGS.bin = True
@@ -529,13 +4261,7 @@ def scenario():
         pver = {}
         parch = {}
         for pkg in LIST[age]:
-            fname = os.path.basename(pkg)
-            kind = "rel"
-            
-            if re.match(r".*-(headers-|devel-|dev-|dev_).*", fname):
-                kind = "devel"
-            elif re.match(r".*-(debuginfo-|dbg[_\-]|dbgsym_).*", fname):
-                kind = "debug"
+            kind = get_pkg_kind(os.path.basename(pkg))
             
             if kind in PKGS[age]:
                 if kind=="rel":
@@ -569,19 +4295,20 @@ def scenario():
             exit_status("Error", age+" release package is not specified ("+age+")")
         
         if "debug" not in PKGS[age]:
-            exit_status("Error", age+" debuginfo package is not specified ("+age+")")
-        
-        if pver["rel"]!=pver["debug"]:
+            if not ARGS.debug_store:
+                exit_status("Error", age+" debuginfo package is not specified ("+age+")")
+        elif pver["rel"]!=pver["debug"]:
             exit_status("Error", "different versions of packages ("+age+")")
         
-        if "devel" in pver:
+        # noarch headers may be packaged separately
+        if "devel" in pver and parch.get("devel") not in NOARCH:
             if pver["rel"]!=pver["devel"]:
                 exit_status("Error", "different versions of packages ("+age+")")
         
-        if parch["rel"]!=parch["debug"]:
+        if "debug" in parch and parch["rel"]!=parch["debug"]:
             exit_status("Error", "different architectures of packages ("+age+")")
         
-        if "devel" in parch:
+        if "devel" in parch and parch["devel"] not in NOARCH:
             if parch["rel"]!=parch["devel"]:
                 exit_status("Error", "different architectures of packages ("+age+")")
         
@@ -616,160 +4343,225 @@ def scenario():
         if ctags_ver.lower().find("universal")==-1:
             exit_status("Error", "requires Universal Ctags")
     
-    print "Extracting packages ..."
+    report_dir = get_report_dir()
+    part_dir = report_dir+".part"
+    
+    plan = plan_run(report_dir)
+    if ARGS.dry_run:
+        print_plan(plan, report_dir)
+        s_exit("Ok")
+    
+    if plan["report"] and not ARGS.rebuild_report:
+        exit_status("Ok", "The report already exists: "+report_dir)
+    
+    open_journal(part_dir)
+    
+    if not ARGS.no_space_check:
+        check_space(plan)
+    
+    emit_event("run_start", package=PKGS_ATTR["old"]["name"], ver1=PKGS_ATTR["old"]["ver"], ver2=PKGS_ATTR["new"]["ver"], arch=PKGS_ATTR["old"]["arch"])
+    
     global FILES
-    FILES["old"] = {}
-    FILES["new"] = {}
+    for age in ["old", "new"]:
+        FILES[age] = {"object":[], "debuginfo":[], "header":[], "count":{}}
     
     e_dir = {}
     e_dir["old"] = {}
     e_dir["new"] = {}
     
-    for age in ["old", "new"]:
-        for kind in ["rel", "debug", "devel"]:
-            if kind not in PKGS[age]:
-                continue
-            
-            e_dir[age][kind] = extract_pkgs(age, kind)
-            for root, dirs, files in os.walk(e_dir[age][kind]):
-                for f in files:
-                    fpath = root+"/"+f
-                    
-                    if os.path.islink(fpath):
+    # byte-identical old and new packages are extracted and scanned once
+    identical = {}
+    
+    def extract(kinds, members=None):
+        # members: selected files of packages by (age, kind)
+        if members is None:
+            members = {}
+        
+        print "Extracting packages ..."
+        for kind in kinds:
+            if is_identical(kind):
+                identical[kind] = True
+                if ("new", kind) in members:
+                    # new files are taken from the old package
+                    members[("old", kind)] = sorted(set(members.get(("old", kind), [])+members[("new", kind)]))
+        
+        tasks = []
+        for age in ["old", "new"]:
+            for kind in kinds:
+                if kind not in PKGS[age] or members.get((age, kind))==[]:
+                    continue
+                
+                if age=="new" and kind in identical:
+                    print "Using extracted "+kind+" package(s) (old), identical to new"
+                    e_dir[age][kind] = e_dir["old"][kind]
+                    continue
+                
+                if kind=="devel" and age in SHARED_DEVEL:
+                    if sorted(PKGS[age][kind].keys())==SHARED_DEVEL[age]["pkgs"]:
+                        print "Using shared "+kind+" package(s) ("+age+")"
+                        e_dir[age][kind] = SHARED_DEVEL[age]["dir"]
                         continue
-                    
-                    fkind = None
-                    if kind=="rel":
-                        if is_object(fpath):
-                            fkind = "object"
-                    elif kind=="debug":
-                        if re.match(r".*\.debug\Z", f):
-                            fkind = "debuginfo"
-                        
-                        if get_fmt(PKGS[age]["debug"].keys()[0])=="deb":
-                            if is_object(fpath):
-                                fkind = "debuginfo"
-                    elif kind=="devel":
-                        if fpath.find("/include/")!=-1 or is_header(f):
-                            fkind = "header"
-                    
-                    if fkind:
-                        if fkind not in FILES[age]:
-                            FILES[age][fkind] = {}
-                        FILES[age][fkind][fpath] = 1
-                    
-                    if kind not in FILES[age]:
-                        FILES[age][kind] = {}
-                    
-                    FILES[age][kind][fpath] = 1
+                
+                e_dir[age][kind], e_tasks = extract_pkgs(age, kind, members.get((age, kind)))
+                
+                if all([journal_has("extract", os.path.abspath(e_dir[age][kind])+"/"+pkg) for pkg in PKGS[age][kind]]):
+                    print "Using extracted "+kind+" package(s) ("+age+")"
+                    continue
+                
+                # partially extracted
+                shutil.rmtree(e_dir[age][kind])
+                os.makedirs(e_dir[age][kind])
+                tasks.extend(e_tasks)
+        
+        for task in run_tasks(tasks):
+            if is_failed(task):
+                exit_status("Error", "failed to extract package "+task["package"]+" ("+get_task_error(task)+")")
+            journal_add("extract", task["extr_dir"]+"/"+task["package"])
+        
+        for age in ["old", "new"]:
+            for kind in kinds:
+                if kind not in e_dir[age]:
+                    continue
+                
+                if age=="new" and kind in identical:
+                    FILES[age][FILE_KIND[kind]].extend(FILES["old"][FILE_KIND[kind]])
+                    FILES[age]["count"][kind] = FILES["old"]["count"][kind]
+                    continue
+                
+                if e_dir[age][kind]==SHARED_DEVEL.get(age, {}).get("dir"):
+                    FILES[age]["header"].extend(SHARED_DEVEL[age]["header"])
+                    FILES[age]["count"][kind] = SHARED_DEVEL[age]["count"]
+                    continue
+                
+                if ARGS.extract_cache and (age, kind) not in members:
+                    link_from_cache(age, kind, e_dir[age][kind])
+                else:
+                    classify_files(age, kind, e_dir[age][kind])
+        
+        if ARGS.extract_cache:
+            evict_cache()
+        
+        for age in ["old", "new"]:
+            if "debug" in kinds and "debug" in e_dir[age] and not FILES[age]["debuginfo"]:
+                exit_status("NoDebug", "debuginfo files are not found in "+age+" debuginfo package")
+    
+    # debuginfo and devel packages are extracted if ABI dumps are created
+    selected = (ARGS.objects or ARGS.skip_objects)
+    
+    deferred = []
+    if plan["defer"]:
+        print "Using existing ABI dumps, debuginfo and devel packages are not extracted"
+        deferred = ["debug", "devel"]
+    elif ARGS.fail_fast:
+        # breaks are looked for in release packages first
+        deferred = ["debug", "devel"]
+    elif ARGS.debug_store or selected:
+        # debuginfo packages are extracted if the store has not all files,
+        # only debuginfo of selected objects is extracted
+        deferred = ["debug"]
+    
+    members = {}
+    if selected:
+        for age in ["old", "new"]:
+            if plan["dumps"][age]["objects"] is not None:
+                if not plan["dumps"][age]["objects"]:
+                    exit_status("NoABI", "shared objects matching -objects and -skip-objects are not found in "+age+" release package")
+                members[(age, "rel")] = [glob_escape(f) for f in plan["files"][age]["rel"] if is_selected(os.path.basename(f))]
+    
+    extract([kind for kind in ["rel", "debug", "devel"] if kind not in deferred], members)
     
     abi_dump = {}
+    obj_path = {}
     soname = {}
     short_name = {}
     shortest_name = {}
     
-    for age in ["old", "new"]:
-        print "Creating ABI dumps ("+age+") ..."
-        if "debuginfo" not in FILES[age]:
-            exit_status("NoDebug", "debuginfo files are not found in "+age+" debuginfo package")
+    history = {}
+    failed = {"old":{}, "new":{}}
+    
+    # text ABI dumps converted to the compact format, removed at the
+    # end of the run when no task reads them
+    converted = []
+    
+    def convert_done(task):
+        if is_failed(task):
+            print_err("WARNING: failed to convert ABI dump of "+task["object"]+" to the compact format ("+get_task_error(task)+")")
+            return
         
-        if "object" not in FILES[age]:
-            exit_status("NoABI", "shared objects are not found in "+age+" release package")
+        converted.append(task["path"])
+    
+    def dump_done(task):
+        age = task["age"]
+        oname = task["object"]
+        obj_dump_path = task["path"]
         
-        objects = FILES[age]["object"].keys()
-        objects.sort(key=lambda x: x.lower())
+        if task["ecode"]==0:
+            hkey = (PKGS_ATTR[age]["arch"], PKGS_ATTR[age]["name"])
+            hist = history[hkey].setdefault(get_history_key(oname), {})
+            hist.update({"rss":task["rss"], "dwarf":task["dwarf"], "time":task["time"], "ver":PKGS_ATTR[age]["ver"]})
+        
+        # the dump is written to a temp directory first
+        if os.path.exists(task["tmp_path"]) and not task["killed"]:
+            os.rename(task["tmp_path"], obj_dump_path)
+        
+        if os.path.exists(os.path.dirname(task["tmp_path"])):
+            shutil.rmtree(os.path.dirname(task["tmp_path"]))
+        
+        if not os.path.exists(obj_dump_path):
+            if task["ecode"]==12 and not task["killed"]:
+                return
+            else:
+                print_err("ERROR: failed to create ABI dump for object "+oname+" ("+age+")")
+                failed[age][oname] = "failed to create ABI dump ("+get_task_error(task)+")"
+                return
+        
+        dump_attr = get_dump_attr(obj_dump_path)
+        
+        if dump_attr["empty"]:
+            print "WARNING: empty ABI dump for "+oname+" ("+age+")"
+            remove_dump(obj_dump_path)
+        elif dump_attr["lang"] not in ["C", "C++"]:
+            print "WARNING: unsupported language "+dump_attr["lang"]+" of "+oname+" ("+age+")"
+            remove_dump(obj_dump_path)
+        else:
+            abi_dump[age][oname] = obj_dump_path
+            add_dump(obj_dump_path)
+            journal_add("dump", age+"/"+oname, obj_dump_path)
+            
+            if ARGS.compact_dumps:
+                c_task = new_task("convert", [sys.executable, CMD_PATH, "-compact-dump", os.path.abspath(obj_dump_path)])
+                c_task["msg"] = "Converting ABI dump for "+oname+" ("+age+")"
+                c_task["object"] = oname
+                c_task["path"] = obj_dump_path
+                c_task["done"] = convert_done
+                return [c_task]
+    
+    for age in ["old", "new"]:
+        if not FILES[age]["object"]:
+            exit_status("NoABI", "shared objects are not found in "+age+" release package")
         
         abi_dump[age] = {}
+        obj_path[age] = {}
         soname[age] = {}
         short_name[age] = {}
         shortest_name[age] = {}
         
-        parch = PKGS_ATTR[age]["arch"]
-        pname = PKGS_ATTR[age]["name"]
-        pver = PKGS_ATTR[age]["ver"]
-        
-        dump_dir = "abi_dump"
-        if ARGS.dumps_dir:
-            dump_dir = ARGS.dumps_dir
-        
-        dump_dir += "/"+parch+"/"+pname+"/"+pver
-        print "Using dumps directory: "+dump_dir
-        
-        for obj in objects:
+        for obj in FILES[age]["object"]:
             oname = os.path.basename(obj)
+            if not is_selected(oname):
+                continue
             
+            obj_path[age][oname] = obj
             soname[age][oname] = get_soname(obj)
             short_name[age][oname] = get_short_name(oname)
             shortest_name[age][oname] = get_shortest_name(oname)
-            
-            obj_dump_path = dump_dir+"/"+oname+"/ABI.dump"
-            
-            if os.path.exists(obj_dump_path):
-                if ARGS.rebuild_dumps:
-                    os.remove(obj_dump_path)
-                else:
-                    print "Using existing ABI dump for "+oname
-                    abi_dump[age][oname] = obj_dump_path
-                    continue
-            
-            print "Creating ABI dump for "+oname
-            
-            cmd_d = [ABI_DUMPER, "-o", obj_dump_path, "-lver", pver]
-            
-            if ARGS.quiet:
-                cmd_d.append("-quiet")
-            
-            cmd_d.append("-search-debuginfo")
-            cmd_d.append(e_dir[age]["debug"])
-            
-            if PUBLIC_ABI:
-                if "header" in FILES[age]:
-                    cmd_d.append("-public-headers")
-                    cmd_d.append(e_dir[age]["devel"])
-            
-            if ARGS.use_tu_dump:
-                cmd_d.append("-use-tu-dump")
-                if ARGS.include_preamble:
-                    cmd_d.append("-include-preamble")
-                    cmd_d.append(ARGS.include_preamble)
-                if ARGS.include_paths:
-                    cmd_d.append("-include-paths")
-                    cmd_d.append(ARGS.include_paths)
-            elif ARGS.ignore_tags:
-                cmd_d.append("-ignore-tags")
-                cmd_d.append(ARGS.ignore_tags)
-            
-            if ARGS.keep_registers_and_offsets:
-                cmd_d.append("-keep-registers-and-offsets")
-            
-            cmd_d.append(obj)
-            
-            if ARGS.debug:
-                print "Executing "+" ".join(cmd_d)
-            
-            ecode = 0
-            
-            with open(TMP_DIR_INT+"/log", "a") as log:
-                ecode = subprocess.call(cmd_d, stdout=log)
-            
-            if not os.path.exists(obj_dump_path):
-                if ecode==12:
-                    continue
-                else:
-                    exit_status("Error", "failed to create ABI dump for object "+oname+" ("+age+")")
-            
-            dump_attr = get_dump_attr(obj_dump_path)
-            
-            if dump_attr["empty"]:
-                print "WARNING: empty ABI dump for "+oname+" ("+age+")"
-                os.remove(obj_dump_path)
-            elif dump_attr["lang"] not in ["C", "C++"]:
-                print "WARNING: unsupported language "+dump_attr["lang"]+" of "+oname+" ("+age+")"
-                os.remove(obj_dump_path)
-            else:
-                abi_dump[age][oname] = obj_dump_path
         
-    print "Comparing ABIs ..."
+        if not obj_path[age]:
+            exit_status("NoABI", "shared objects matching -objects and -skip-objects are not found in "+age+" release package")
+    
+    print "Matching objects ..."
+    emit_event("stage_start", stage="match")
+    match_start = time.time()
     soname_r = {}
     short_name_r = {}
     shortest_name_r = {}
@@ -796,11 +4588,9 @@ def scenario():
                 shortest_name_r[age][shname] = {}
             shortest_name_r[age][shname][obj] = 1
     
-    old_objects = abi_dump["old"].keys()
-    new_objects = abi_dump["new"].keys()
-    
-    if objects and not old_objects:
-        exit_status("Empty", "all ABI dumps are empty or invalid")
+    # objects are matched before dumping, only mapped ones are dumped
+    old_objects = obj_path["old"].keys()
+    new_objects = obj_path["new"].keys()
     
     old_objects.sort(key=lambda x: x.lower())
     new_objects.sort(key=lambda x: x.lower())
@@ -809,25 +4599,9 @@ def scenario():
     mapped_r = {}
     removed = {}
     
-    report_dir = None
-    if ARGS.report_dir:
-        report_dir = ARGS.report_dir
-    else:
-        report_dir = "compat_report"
-        report_dir += "/"+PKGS_ATTR["old"]["arch"]+"/"+PKGS_ATTR["old"]["name"]
-        report_dir += "/"+PKGS_ATTR["old"]["ver"]+"/"+PKGS_ATTR["new"]["ver"]
-    
-    if os.path.exists(report_dir):
-        if ARGS.rebuild_report:
-            if os.path.exists(report_dir+"/index.html"):
-                os.remove(report_dir+"/index.html")
-        else:
-            exit_status("Ok", "The report already exists: "+report_dir)
-    else:
-        os.makedirs(report_dir)
-    
     compat = {}
     renamed_object = {}
+    match_method = {}
     for obj in old_objects:
         new_obj = None
         
@@ -838,11 +4612,13 @@ def scenario():
                 bysoname = soname_r["new"][sname].keys()
                 if bysoname and len(bysoname)==1:
                     new_obj = bysoname[0]
+                    match_method[obj] = "soname"
         
         # match by name
         if new_obj is None:
             if obj in new_objects:
                 new_obj = obj
+                match_method[obj] = "name"
         
         # match by short name
         if new_obj is None:
@@ -852,6 +4628,7 @@ def scenario():
                     byshort = short_name_r["new"][shname].keys()
                     if byshort and len(byshort)==1:
                         new_obj = byshort[0]
+                        match_method[obj] = "short name"
         
         # match by shortest name
         if new_obj is None:
@@ -861,6 +4638,7 @@ def scenario():
                     byshort = shortest_name_r["new"][shname].keys()
                     if byshort and len(byshort)==1:
                         new_obj = byshort[0]
+                        match_method[obj] = "shortest name"
         
         if new_obj is None:
             removed[obj] = 1
@@ -874,6 +4652,28 @@ def scenario():
         if obj not in mapped_r:
             added[obj] = 1
     
+    # match renamed and split objects by exported symbols
+    similarity = {}
+    dynsym = {"old":{}, "new":{}}
+    if removed and added:
+        for obj in removed:
+            dynsym["old"][obj] = get_dynsym(obj_path["old"][obj])
+        for obj in added:
+            dynsym["new"][obj] = get_dynsym(obj_path["new"][obj])
+        
+        bysymbols = match_by_symbols(dynsym["old"], dynsym["new"], ARGS.match_threshold)
+        for obj in bysymbols:
+            new_obj, similarity[obj] = bysymbols[obj]
+            print "Matched "+obj+" (old) and "+new_obj+" (new) by exported symbols ("+format_num(100*similarity[obj])+"%)"
+            
+            mapped[obj] = new_obj
+            mapped_r[new_obj] = obj
+            renamed_object[obj] = new_obj
+            match_method[obj] = "symbols"
+            
+            removed.pop(obj, None)
+            added.pop(new_obj, None)
+    
     # one object
     if not mapped:
         if len(old_objects)==1 and len(new_objects)==1:
@@ -882,24 +4682,133 @@ def scenario():
             
             mapped[obj] = new_obj
             renamed_object[obj] = new_obj
+            match_method[obj] = "single object"
             
             removed.pop(obj, None)
             added.pop(new_obj, None)
     
-    mapped_objs = mapped.keys()
-    mapped_objs.sort(key=lambda x: x.lower())
-    for obj in mapped_objs:
+    emit_event("stage_finish", stage="match", duration=round(time.time()-match_start, 3), mapped=len(mapped), added=len(added), removed=len(removed))
+    
+    # likely breaks are dumped and compared first
+    break_rank = {}
+    if ARGS.fail_fast:
+        brk = find_break(mapped, removed, soname, obj_path)
+        if brk:
+            print "ABI break: "+brk
+            s_exit("Break")
+        
+        for obj in mapped:
+            break_rank[obj] = get_break_rank(obj_path["old"][obj], obj_path["new"][mapped[obj]])
+    
+    store_debug = {"old":{}, "new":{}}
+    if deferred:
+        to_dump = {"old":[], "new":[]}
+        for obj in mapped:
+            for age, oname in [("old", obj), ("new", mapped[obj])]:
+                if ARGS.rebuild_dumps or not has_dump(get_dump_dir(age)+"/"+oname+"/ABI.dump"):
+                    to_dump[age].append(oname)
+        
+        kinds = deferred
+        if ARGS.debug_store and (to_dump["old"] or to_dump["new"]):
+            print "Looking up debuginfo in the debug store ..."
+            for age in ["old", "new"]:
+                store_debug[age] = link_debug_store(age, [obj_path[age][oname] for oname in to_dump[age]])
+            
+            if all([len(store_debug[age])==len(to_dump[age]) for age in ["old", "new"]]):
+                kinds = [kind for kind in deferred if kind!="debug"]
+            else:
+                for age in ["old", "new"]:
+                    for oname in to_dump[age]:
+                        if oname not in store_debug[age]:
+                            print "Debuginfo of "+oname+" ("+age+") is not found in the debug store"
+                    
+                    if "debug" not in PKGS[age] and not store_debug[age]:
+                        exit_status("NoDebug", "debuginfo files are not found in the debug store ("+age+")")
+        
+        members = {}
+        if selected and "debug" in kinds:
+            for age in ["old", "new"]:
+                if to_dump[age]:
+                    members[(age, "debug")] = get_debug_members([obj_path[age][oname] for oname in to_dump[age]])
+                else:
+                    members[(age, "debug")] = []
+        
+        if kinds and (to_dump["old"] or to_dump["new"]):
+            if kinds==deferred and plan["defer"]:
+                print "ABI dumps are not found, extracting debuginfo and devel packages"
+            extract(kinds, members)
+        deferred = [kind for kind in deferred if kind not in e_dir["old"]]
+    
+    def compare_done(task):
+        obj = task["object"]
+        bin_report = task["bin_report"]
+        src_report = task["src_report"]
+        
+        if task["killed"]:
+            print_err("ERROR: failed to compare object "+obj+" ("+get_task_error(task)+")")
+            failed["old"][obj] = "failed to compare ("+get_task_error(task)+")"
+            if os.path.exists(part_dir+"/"+obj):
+                shutil.rmtree(part_dir+"/"+obj)
+            return
+        
+        if ARGS.bin:
+            if not os.path.exists(bin_report):
+                print_err("ERROR: failed to create BC report for object "+obj)
+                failed["old"][obj] = "failed to create BC report ("+get_task_error(task)+")"
+                return
+        
+        if ARGS.src:
+            if not os.path.exists(src_report):
+                print_err("ERROR: failed to create SC report for object "+obj)
+                failed["old"][obj] = "failed to create SC report ("+get_task_error(task)+")"
+                return
+        
+        compat[obj] = {}
+        res = []
+        
+        if ARGS.bin:
+            compat[obj]["bin"] = read_stat(bin_report, part_dir)
+            res.append("BC: "+format_num(100-float(compat[obj]["bin"]["affected"]))+"%")
+        
+        if ARGS.src:
+            compat[obj]["src"] = read_stat(src_report, part_dir)
+            res.append("SC: "+format_num(100-float(compat[obj]["src"]["affected"]))+"%")
+        
+        print ", ".join(res)
+        journal_add("compare", obj, compat[obj])
+        
+        old_history = history[(PKGS_ATTR["old"]["arch"], PKGS_ATTR["old"]["name"])]
+        hist = old_history.setdefault(get_history_key(obj), {})
+        hist.update({"compare_time":task["time"], "dumps_size":task["dumps_size"]})
+        
+        if ARGS.fail_fast:
+            check_break(obj, compat[obj])
+    
+    compared = {}
+    def compare_task(obj):
+        # None if the objects are compared already or not dumped
         new_obj = mapped[obj]
         
+        if obj in compared:
+            return None
+        
         if obj not in abi_dump["old"]:
-            continue
+            return None
         
         if new_obj not in abi_dump["new"]:
-            continue
+            return None
         
-        print "Comparing "+obj+" (old) and "+new_obj+" (new)"
+        compared[obj] = 1
         
-        obj_report_dir = report_dir+"/"+obj
+        if journal_has("compare", obj):
+            print "Using existing comparison result for "+obj
+            emit_event("cache", cache="journal", object=obj, hit=True)
+            compat[obj] = journal_get("compare", obj)
+            if ARGS.fail_fast:
+                check_break(obj, compat[obj])
+            return None
+        
+        obj_report_dir = part_dir+"/"+obj
         
         if os.path.exists(obj_report_dir):
             shutil.rmtree(obj_report_dir)
@@ -911,48 +4820,198 @@ def scenario():
         
         if ARGS.bin:
             cmd_c.append("-bin")
-            cmd_c.extend(["-bin-report-path", bin_report])
+            cmd_c.extend(["-bin-report-path", os.path.abspath(bin_report)])
         if ARGS.src:
             cmd_c.append("-src")
-            cmd_c.extend(["-src-report-path", src_report])
+            cmd_c.extend(["-src-report-path", os.path.abspath(src_report)])
+        
+        old_dump = get_text_dump(abi_dump["old"][obj])
+        new_dump = get_text_dump(abi_dump["new"][new_obj])
         
         cmd_c.append("-old")
-        cmd_c.append(abi_dump["old"][obj])
+        cmd_c.append(os.path.abspath(old_dump))
         
         cmd_c.append("-new")
-        cmd_c.append(abi_dump["new"][new_obj])
+        cmd_c.append(os.path.abspath(new_dump))
         
-        if ARGS.debug:
-            print "Executing "+" ".join(cmd_c)
+        old_history = history[(PKGS_ATTR["old"]["arch"], PKGS_ATTR["old"]["name"])]
+        task = new_task("compare", cmd_c)
+        task["dumps"] = [(len(cmd_c)-3, abi_dump["old"][obj]), (len(cmd_c)-1, abi_dump["new"][new_obj])]
+        task["msg"] = "Comparing "+obj+" (old) and "+new_obj+" (new)"
+        task["stdout"] = os.path.abspath(TMP_DIR_INT+"/log")
+        task["object"] = obj
+        task["bin_report"] = bin_report
+        task["src_report"] = src_report
+        task["done"] = compare_done
+        task["dumps_size"] = os.path.getsize(old_dump)+os.path.getsize(new_dump)
+        task["cost"] = estimate_compare_time(task["dumps_size"], old_history.get(get_history_key(obj)))
+        task["priority"] = break_rank.get(obj, 0)
+        return task
+    
+    def dump_compare_done(task):
+        # in -fail-fast mode objects are compared as soon as both ABI
+        # dumps are created
+        more = dump_done(task) or []
+        if task["age"]=="old":
+            obj = task["object"]
+        else:
+            obj = mapped_r[task["object"]]
         
-        with open(TMP_DIR_INT+"/log", "w") as log:
-            subprocess.call(cmd_c, stdout=log)
+        task = compare_task(obj)
+        if task:
+            more.append(task)
+        return more
+    
+    tasks = []
+    for age in ["old", "new"]:
+        print "Creating ABI dumps ("+age+") ..."
         
-        if ARGS.bin:
-            if not os.path.exists(bin_report):
-                print_err("ERROR: failed to create BC report for object "+obj)
-                continue
+        if age=="old":
+            objects = mapped.keys()
+        else:
+            objects = mapped.values()
+        objects.sort(key=lambda x: x.lower())
         
-        if ARGS.src:
-            if not os.path.exists(src_report):
-                print_err("ERROR: failed to create SC report for object "+obj)
-                continue
+        parch = PKGS_ATTR[age]["arch"]
+        pname = PKGS_ATTR[age]["name"]
+        pver = PKGS_ATTR[age]["ver"]
         
-        compat[obj] = {}
-        res = []
+        dump_dir = get_dump_dir(age)
+        print "Using dumps directory: "+dump_dir
         
-        if ARGS.bin:
-            compat[obj]["bin"] = read_stat(bin_report, report_dir)
-            res.append("BC: "+format_num(100-float(compat[obj]["bin"]["affected"]))+"%")
+        if (parch, pname) not in history:
+            history[(parch, pname)] = read_history(parch, pname)
+        debug_index = index_debuginfo(FILES[age]["debuginfo"]+store_debug[age].values())
         
-        if ARGS.src:
-            compat[obj]["src"] = read_stat(src_report, report_dir)
-            res.append("SC: "+format_num(100-float(compat[obj]["src"]["affected"]))+"%")
+        for oname in objects:
+            obj = obj_path[age][oname]
+            obj_dump_path = dump_dir+"/"+oname+"/ABI.dump"
+            
+            if has_dump(obj_dump_path):
+                if ARGS.rebuild_dumps and not journal_has("dump", age+"/"+oname):
+                    remove_dump(obj_dump_path)
+                    emit_event("cache_evict", cache="dump", object=oname, age=age, count=1)
+                else:
+                    print "Using existing ABI dump for "+oname
+                    emit_event("cache", cache="dump", object=oname, age=age, hit=True)
+                    abi_dump[age][oname] = obj_dump_path
+                    continue
+            
+            emit_event("cache", cache="dump", object=oname, age=age, hit=False)
+            clean_dump_tmp(dump_dir+"/"+oname)
+            tmp_dump_path = dump_dir+"/"+oname+"/.tmp-"+socket.gethostname()+"-"+str(os.getpid())+"/ABI.dump"
+            cmd_d = [ABI_DUMPER, "-o", os.path.abspath(tmp_dump_path), "-lver", pver]
+            
+            if ARGS.quiet:
+                cmd_d.append("-quiet")
+            
+            cmd_d.append("-search-debuginfo")
+            if oname in store_debug[age] or "debug" not in e_dir[age]:
+                cmd_d.append(os.path.abspath(TMP_DIR_INT+"/debug-store/"+age))
+            else:
+                cmd_d.append(os.path.abspath(e_dir[age]["debug"]))
+            
+            if PUBLIC_ABI:
+                if FILES[age]["header"]:
+                    cmd_d.append("-public-headers")
+                    cmd_d.append(os.path.abspath(e_dir[age]["devel"]))
+            
+            if ARGS.use_tu_dump:
+                cmd_d.append("-use-tu-dump")
+                if ARGS.include_preamble:
+                    cmd_d.append("-include-preamble")
+                    cmd_d.append(ARGS.include_preamble)
+                if ARGS.include_paths:
+                    cmd_d.append("-include-paths")
+                    cmd_d.append(ARGS.include_paths)
+            elif ARGS.ignore_tags:
+                cmd_d.append("-ignore-tags")
+                cmd_d.append(os.path.abspath(ARGS.ignore_tags))
+            
+            if ARGS.keep_registers_and_offsets:
+                cmd_d.append("-keep-registers-and-offsets")
+            
+            cmd_d.append(os.path.abspath(obj))
+            
+            task = new_task("dump", cmd_d)
+            task["msg"] = "Creating ABI dump for "+oname
+            task["stdout"] = os.path.abspath(TMP_DIR_INT+"/log")
+            task["age"] = age
+            task["object"] = oname
+            task["path"] = obj_dump_path
+            task["tmp_path"] = tmp_dump_path
+            task["done"] = dump_done
+            task["ok"] = [0, 12]
+            if age=="old":
+                task["priority"] = break_rank.get(oname, 0)
+            else:
+                task["priority"] = break_rank.get(mapped_r[oname], 0)
+            if ARGS.fail_fast:
+                task["done"] = dump_compare_done
+            hist = history[(parch, pname)].get(get_history_key(oname))
+            task["mem"], task["dwarf"] = estimate_mem(obj, debug_index, hist)
+            task["cost"] = estimate_dump_time(obj, task["dwarf"], hist)
+            tasks.append(task)
+    
+    if ARGS.fail_fast:
+        # both ABI dumps exist
+        print "Comparing ABIs ..."
+        for obj in sorted(mapped, key=lambda x: x.lower()):
+            task = compare_task(obj)
+            if task:
+                tasks.append(task)
+    
+    run_tasks(tasks)
+    
+    for parch, pname in history:
+        write_history(parch, pname, history[(parch, pname)])
+    
+    dumps_dir = "abi_dump"
+    if ARGS.dumps_dir:
+        dumps_dir = ARGS.dumps_dir
+    update_symbol_index(dumps_dir, abi_dump["old"].values()+abi_dump["new"].values())
+    
+    if mapped and not abi_dump["old"] and not failed["old"]:
+        exit_status("Empty", "all ABI dumps are empty or invalid")
+    
+    # objects with empty or invalid ABI dumps are not reported,
+    # objects with failed dumps are reported as N/A
+    for obj in mapped.keys():
+        new_obj = mapped[obj]
         
-        print ", ".join(res)
+        if obj in failed["old"] or new_obj in failed["new"]:
+            continue
+        
+        if obj in abi_dump["old"] and new_obj in abi_dump["new"]:
+            continue
+        
+        del mapped[obj]
+        del mapped_r[new_obj]
+        
+        if obj in abi_dump["old"]:
+            removed[obj] = 1
+        else:
+            old_objects.remove(obj)
+        
+        if new_obj in abi_dump["new"]:
+            added[new_obj] = 1
+        else:
+            new_objects.remove(new_obj)
+    
+    if not ARGS.fail_fast:
+        print "Comparing ABIs ..."
+    tasks = []
+    mapped_objs = mapped.keys()
+    mapped_objs.sort(key=lambda x: x.lower())
+    for obj in mapped_objs:
+        task = compare_task(obj)
+        if task:
+            tasks.append(task)
     
-    if mapped_objs and not compat:
-        exit_status("Error", "failed to create reports for objects")
+    run_tasks(tasks)
+    
+    for parch, pname in history:
+        write_history(parch, pname, history[(parch, pname)])
     
     object_symbols = {}
     changed_soname = {}
@@ -979,14 +5038,31 @@ def scenario():
     
     total_funcs = 0
     
-    for obj in compat:
+    tasks = {}
+    for obj in compat.keys():
+        if not journal_has("count", obj):
+            tasks[obj] = count_symbols(abi_dump["old"][obj], obj, "old")
+    
+    for task in run_tasks(tasks.values()):
+        if not is_failed(task):
+            journal_add("count", task["object"], read_count(task))
+    
+    for obj in compat.keys():
         if ARGS.bin:
             report = compat[obj]["bin"]
         else:
             report = compat[obj]["src"]
         
-        old_dump = abi_dump["old"][obj]
-        funcs = count_symbols(old_dump, obj, "old")
+        if journal_has("count", obj):
+            funcs = journal_get("count", obj)
+        else:
+            funcs = read_count(tasks[obj])
+        
+        if funcs is None:
+            failed["old"][obj] = "failed to count symbols ("+get_task_error(tasks[obj])+")"
+            del compat[obj]
+            continue
+        
         object_symbols[obj] = funcs
         
         affected_t_delta = float(report["affected"])*funcs
@@ -1011,9 +5087,11 @@ def scenario():
     
     removed_by_objects_t = 0
     
+    # removed objects are not dumped, count their exported symbols
     for obj in removed:
-        old_dump = abi_dump["old"][obj]
-        removed_by_objects_t += count_symbols(old_dump, obj, "old")
+        if obj not in dynsym["old"]:
+            dynsym["old"][obj] = get_dynsym(obj_path["old"][obj])
+        removed_by_objects_t += len(dynsym["old"][obj])
     
     bc = 100
     bc_eff = 100
@@ -1027,7 +5105,7 @@ def scenario():
         if total_funcs:
             bc_src -= affected_t_src/total_funcs
     
-    if old_objects and removed:
+    if old_objects and removed and total_funcs+removed_by_objects_t:
         delta = (1-(removed_by_objects_t/(total_funcs+removed_by_objects_t)))
         bc *= delta
         if ARGS.src:
@@ -1039,261 +5117,106 @@ def scenario():
     if ARGS.src:
         bc_src = format_num(bc_src)
     
-    meta = []
-    if ARGS.bin:
-        meta.append("\"BC\": "+str(bc))
-        meta.append("\"BC_Effective\": "+str(bc_eff))
-    if ARGS.src:
-        meta.append("\"Source_BC\": "+str(bc_src))
-    meta.append("\"Added\": "+str(added_t))
-    meta.append("\"Removed\": "+str(removed_t))
-    if ARGS.bin:
-        meta.append("\"TotalProblems\": "+str(problems_t))
-    if ARGS.src:
-        meta.append("\"Source_TotalProblems\": "+str(problems_t_src))
-    meta.append("\"ObjectsAdded\": "+str(len(added)))
-    meta.append("\"ObjectsRemoved\": "+str(len(removed)))
-    meta.append("\"ChangedSoname\": "+str(len(changed_soname)))
-    
-    write_file(report_dir+"/meta.json", "{\n  "+",\n  ".join(meta)+"\n}\n")
-    
-    # HTML report
-    n1 = PKGS_ATTR["old"]["name"]
-    n2 = PKGS_ATTR["new"]["name"]
-    
-    v1 = PKGS_ATTR["old"]["ver"]
-    v2 = PKGS_ATTR["new"]["ver"]
-    
-    arch = PKGS_ATTR["old"]["arch"]
-    
-    report = "<h1>ABI report"
-    if n1==n2:
-        title = n1+": API/ABI report between "+v1+" and "+v2+" versions"
-        keywords = n1+", API, ABI, changes, compatibility, report"
-        desc = "API/ABI compatibility report between "+v1+" and "+v2+" versions of the "+n1
-        report += " for "+n1+": <u>"+v1+"</u> vs <u>"+v2+"</u>"
-    else:
-        title = "API/ABI report between "+n1+"-"+v1+" and "+n2+"-"+v2+" packages"
-        keywords = n1+", "+n2+", API, ABI, changes, compatibility, report"
-        desc = "API/ABI compatibility report between "+n1+"-"+v1+" and "+n2+"-"+v2+" packages"
-        report += " for <u>"+n1+"-"+v1+"</u> vs <u>"+n2+"-"+v2+"</u>"
-    
-    if not ARGS.bin:
-        report += " (source compatibility)"
-    
-    report += "</h1>\n"
-    
-    report += "<h2>Test Info</h2>\n"
-    report += "<table class='summary'>\n"
-    report += "<tr>\n"
-    report += "<th class='left'>Package</th><td class='right'>"+n1+"</td>\n"
-    report += "</tr>\n"
-    report += "<tr>\n"
-    report += "<th class='left'>Old Version</th><td class='right'>"+v1+"</td>\n"
-    report += "</tr>\n"
-    report += "<tr>\n"
-    report += "<th class='left'>New Version</th><td class='right'>"+v2+"</td>\n"
-    report += "</tr>\n"
-    report += "<tr>\n"
-    report += "<th class='left'>Arch</th><td class='right'>"+arch+"</td>\n"
-    report += "</tr>\n"
-    report += "<tr>\n"
-    if PUBLIC_ABI:
-        report += "<th class='left'>Subject</th><td class='right'>Public ABI</td>\n"
-    else:
-        report += "<th class='left'>Subject</th><td class='right'>Public ABI +<br/>Private ABI</td>\n"
-    report += "</tr>\n"
-    report += "</table>\n"
-    
-    report += "<h2>Test Result</h2>\n"
-    report += "<span class='result'>\n"
-    if ARGS.bin:
-        report += "Binary compatibility: <span class='"+get_bc_class(bc_eff, problems_t)+"' title='Avg. binary compatibility rate'>"+bc_eff+"%</span>\n"
-        if changed_soname.keys():
-            report += " (<span class='incompatible' title='Effective binary compatibility is "+bc_eff+"%"+" due to changed SONAME'>changed SONAME</span>)"
-        report += "<br/>\n"
+    model = {}
+    model["name1"] = PKGS_ATTR["old"]["name"]
+    model["name2"] = PKGS_ATTR["new"]["name"]
+    model["ver1"] = PKGS_ATTR["old"]["ver"]
+    model["ver2"] = PKGS_ATTR["new"]["ver"]
+    model["arch"] = PKGS_ATTR["old"]["arch"]
+    model["public_abi"] = PUBLIC_ABI
+    model["objects_only"] = ARGS.objects
+    model["objects_skip"] = ARGS.skip_objects
+    model["bin"] = ARGS.bin
+    model["src"] = ARGS.src
     
+    model["bc"] = bc
+    model["bc_eff"] = bc_eff
+    model["problems"] = problems_t
     if ARGS.src:
-        report += "Source compatibility: <span class='"+get_bc_class(bc_src, problems_t_src)+"' title='Avg. source compatibility rate'>"+bc_src+"%</span>\n"
-        report += "<br/>\n"
-    
-    report += "</span>\n"
-    
-    report += "<h2>Packages</h2>\n"
-    report += "<table class='summary'>\n"
-    report += "<tr>\n"
-    report += "<th>Old</th><th>New</th><th title='*.so, *.debug and header files'>Files</th>\n"
-    report += "</tr>\n"
-    
-    target = {}
-    target["rel"] = "object"
-    target["debug"] = "debuginfo"
-    target["devel"] = "header"
+        model["bc_src"] = bc_src
+        model["problems_src"] = problems_t_src
+    model["added"] = added_t
+    model["removed"] = removed_t
+    model["objects_added"] = len(added)
+    model["objects_removed"] = len(removed)
+    model["changed_soname"] = len(changed_soname)
+    model["failed"] = len(failed["old"])+len(failed["new"])
     
+    model["packages"] = []
     for kind in ["rel", "debug", "devel"]:
         if kind=="devel" and not PUBLIC_ABI:
             continue
         
+        if kind not in PKGS["old"] or kind not in PKGS["new"]:
+            # debuginfo from the debug store
+            continue
+        
         pkgs1 = PKGS["old"][kind].keys()
         pkgs2 = PKGS["new"][kind].keys()
         
         pkgs1.sort(key=lambda x: x.lower())
         pkgs2.sort(key=lambda x: x.lower())
         
-        total = len(pkgs1)
-        
-        pfiles = False
-        
-        for i in range(0, total):
-            report += "<tr>\n"
-            report += "<td class='object'>"+os.path.basename(pkgs1[i])+"</td>\n"
-            report += "<td class='object'>"+os.path.basename(pkgs2[i])+"</td>\n"
-            if not pfiles:
-                if total>1:
-                    report += "<td class='center' rowspan='"+str(total)+"'>"
-                else:
-                    report += "<td class='center'>"
-                if target[kind] in FILES["old"]:
-                    report += str(len(FILES["old"][target[kind]]))
-                else:
-                    report += "0"
-                report += "</td>\n"
-                pfiles = True
-            report += "</tr>\n"
-    
-    report += "</table>\n"
-    
-    report += "<h2>Shared Objects</h2>\n"
-    report += "<table class='summary'>\n"
-    
-    cols = 5
-    if ARGS.bin and ARGS.src:
-        report += "<tr>\n"
-        report += "<th rowspan='2'>Object</th>\n"
-        report += "<th colspan='2'>Compatibility</th>\n"
-        report += "<th rowspan='2'>Added<br/>Symbols</th>\n"
-        report += "<th rowspan='2'>Removed<br/>Symbols</th>\n"
-        report += "<th rowspan='2'>Total<br/>Symbols</th>\n"
-        report += "</tr>\n"
-        
-        report += "<tr>\n"
-        report += "<th title='Binary compatibility'>BC</th>\n"
-        report += "<th title='Source compatibility'>SC</th>\n"
-        report += "</tr>\n"
-    else:
-        cols -= 1
-        report += "<tr>\n"
-        report += "<th>Object</th>\n"
-        
-        if ARGS.bin:
-            report += "<th>Binary<br/>Compatibility</th>\n"
+        if kind in deferred:
+            # not extracted, counted in the package list
+            files = len(plan["files"]["old"].get(kind, []))
         else:
-            report += "<th>Source<br/>Compatibility</th>\n"
+            files = len(FILES["old"][FILE_KIND[kind]])
         
-        report += "<th>Added<br/>Symbols</th>\n"
-        report += "<th>Removed<br/>Symbols</th>\n"
-        report += "<th>Total<br/>Symbols</th>\n"
-        report += "</tr>\n"
+        model["packages"].append({
+            "kind":kind,
+            "old":[os.path.basename(p) for p in pkgs1],
+            "new":[os.path.basename(p) for p in pkgs2],
+            "files":files
+        })
     
+    model["objects"] = []
     for obj in new_objects:
         if obj in added:
-            report += "<tr>\n"
-            report += "<td class='object'>"+obj+"</td>\n"
-            report += "<td colspan=\'"+str(cols)+"\' class='added'>Added to package</td>\n"
-            report += "</tr>\n"
+            model["objects"].append({"name":obj, "status":"added"})
     
     for obj in old_objects:
-        report += "<tr>\n"
-        
-        name = obj
+        row = {"name":obj}
         
         if obj in mapped:
+            row["new_name"] = mapped[obj]
+            row["match"] = match_method[obj]
+            if obj in similarity:
+                row["similarity"] = format_num(100*similarity[obj])
             if obj in changed_soname:
-                name += "<br/>"
-                name += "<br/>"
-                name += "<span class='incompatible'>(changed SONAME from<br/>\""+soname["old"][obj]+"\"<br/>to<br/>\""+changed_soname[obj]+"\")</span>"
+                row["soname"] = [soname["old"][obj], changed_soname[obj]]
             elif obj in renamed_object:
-                name += "<br/>"
-                name += "<br/>"
-                name += "<span class='incompatible'>(changed file name from<br/>\""+obj+"\"<br/>to<br/>\""+renamed_object[obj]+"\")</span>"
-        
-        report += "<td class='object'>"+name+"</td>\n"
-        
-        if obj in mapped:
-            if obj not in compat:
-                for i in range(0, cols):
-                    report += "<td>N/A</td>\n"
-                continue
-            
-            if ARGS.bin:
-                rate = 100 - float(compat[obj]["bin"]["affected"])
-                added_symbols = compat[obj]["bin"]["added"]
-                removed_symbols = compat[obj]["bin"]["removed"]
-                total = compat[obj]["bin"]["total"]
-                cclass = get_bc_class(rate, total)
-                rpath = compat[obj]["bin"]["path"]
-            
-            if ARGS.src:
-                rate_src = 100 - float(compat[obj]["src"]["affected"])
-                added_symbols_src = compat[obj]["src"]["added"]
-                removed_symbols_src = compat[obj]["src"]["removed"]
-                total_src = compat[obj]["src"]["total"]
-                cclass_src = get_bc_class(rate_src, total_src)
-                rpath_src = compat[obj]["src"]["path"]
-            
-            if ARGS.bin:
-                report += "<td class=\'"+cclass+"\'>"
-                report += "<a href='"+rpath+"'>"+format_num(rate)+"%</a>"
-                report += "</td>\n"
-            
-            if ARGS.src:
-                report += "<td class=\'"+cclass_src+"\'>"
-                report += "<a href='"+rpath_src+"'>"+format_num(rate_src)+"%</a>"
-                report += "</td>\n"
+                row["renamed"] = True
             
-            if not ARGS.bin:
-                if int(added_symbols_src)>0:
-                    report += "<td class='added'><a class='num' href='"+rpath_src+"#Added'>"+added_symbols_src+" new</a></td>\n"
-                else:
-                    report += "<td class='ok'>0</td>\n"
-                
-                if int(removed_symbols_src)>0:
-                    report += "<td class='removed'><a class='num' href='"+rpath_src+"#Removed'>"+removed_symbols_src+" removed</a></td>\n"
-                else:
-                    report += "<td class='ok'>0</td>\n"
+            if obj in compat:
+                row["status"] = "compared"
+                row["symbols"] = object_symbols[obj]
+                row.update(compat[obj])
             else:
-                if int(added_symbols)>0:
-                    report += "<td class='added'><a class='num' href='"+rpath+"#Added'>"+added_symbols+" new</a></td>\n"
-                else:
-                    report += "<td class='ok'>0</td>\n"
-                
-                if int(removed_symbols)>0:
-                    report += "<td class='removed'><a class='num' href='"+rpath+"#Removed'>"+removed_symbols+" removed</a></td>\n"
-                else:
-                    report += "<td class='ok'>0</td>\n"
-            
-            report += "<td>"+str(object_symbols[obj])+"</td>\n"
-        elif obj in removed:
-            report += "<td colspan=\'"+str(cols)+"\' class='removed'>Removed from package</td>\n"
+                row["status"] = "n/a"
+                if obj in failed["old"]:
+                    row["reason"] = failed["old"][obj]
+                elif mapped[obj] in failed["new"]:
+                    row["reason"] = "new object: "+failed["new"][mapped[obj]]
+        else:
+            row["status"] = "removed"
+            if obj in failed["old"]:
+                row["reason"] = failed["old"][obj]
         
-        report += "</tr>\n"
+        model["objects"].append(row)
     
-    report += "</table>\n"
+    # other runs use the compact ABI dumps from now on
+    for path in converted:
+        if os.path.exists(path) and os.path.exists(get_compact_path(path)):
+            os.remove(path)
     
-    report += "<br/>\n"
-    report += "<br/>\n"
-    
-    report += "<hr/>\n"
-    report += "<div class='footer' align='right'><i>Generated by <a href='https://github.com/lvc/pkg-abidiff'>Package ABI Diff</a> "+TOOL_VERSION+" &#160;</i></div>\n"
-    report += "<br/>\n"
-    
-    report = compose_html_head(title, keywords, desc)+"<body>\n"+report+"\n</body>\n</html>\n"
-    
-    if not os.path.exists(report_dir):
-        os.makedirs(report_dir)
-    
-    write_file(report_dir+"/index.html", report)
+    write_meta(part_dir+"/meta.json", model)
+    write_html_report(part_dir+"/index.html", model)
+    finalize_report(part_dir, report_dir)
+    if ARGS.results_db:
+        add_results(ARGS.results_db, model, report_dir)
     print "The report has been generated to: "+report_dir+"/index.html"
+    emit_event("report", path=report_dir+"/index.html", bc=bc, bc_eff=bc_eff)
     
     res = []
     
@@ -1305,10 +5228,14 @@ def scenario():
     
     print ", ".join(res)
     
+    if model["failed"]:
+        print_err("WARNING: the report is incomplete, failed to process "+str(model["failed"])+" object(s)")
+        s_exit("Partial")
+    
     s_exit("Ok")
 
 try:
     scenario()
 except Exception as e:
     print traceback.format_exc()
-    s_exit("Error")
+    s_exit("Error", True)